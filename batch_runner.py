@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Groq quotas for llama3-70b-8192 (per API key). Override with --rpm / --tpm for other tiers.
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 6000
+# Groq quotas are per model: llama3-8b-8192, the small routing model, has its own.
+# Override with --small-rpm / --small-tpm.
+DEFAULT_SMALL_REQUESTS_PER_MINUTE = 30
+DEFAULT_SMALL_TOKENS_PER_MINUTE = 30000
+
+MAX_RETRIES = 3
+BASE_RETRY_DELAY = 2.0  # seconds
+MAX_RETRY_DELAY = 60.0  # seconds
+
+# Tokens reserved for the completion before the real usage is known.
+COMPLETION_TOKEN_ESTIMATE = 512
+CHARS_PER_TOKEN = 4
+
+
+#*-----------------Rate limiting-----------------*#
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` units per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        # Requests larger than the bucket would never fit; let them through once it is full.
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                wait = (amount - self._level) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) units without blocking; the level may go into debt."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - delta)
+
+
+class UnlimitedBucket:
+    """Stands in for a TokenBucket whose quota was not given."""
+
+    def acquire(self, amount=1):
+        pass
+
+    def adjust(self, delta):
+        pass
+
+
+class GroqRateLimiter(BaseCallbackHandler):
+    """
+    LangChain callback that blocks every chat-model call until it fits into the
+    request and token quotas. Token usage is reserved from an estimate when the
+    call starts and reconciled with the provider's reported usage when it ends.
+    A quota given as None is not limited.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = UnlimitedBucket()
+        if requests_per_minute:
+            self.requests = TokenBucket(requests_per_minute / 60.0, requests_per_minute)
+        self.tokens = UnlimitedBucket()
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def attach(self, llm):
+        callbacks = llm.callbacks if isinstance(llm.callbacks, list) else []
+        if self not in callbacks:
+            callbacks.append(self)
+        llm.callbacks = callbacks
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        chars = sum(len(str(m.content)) for batch in messages for m in batch)
+        estimate = chars // CHARS_PER_TOKEN + COMPLETION_TOKEN_ESTIMATE
+        self.requests.acquire(1)
+        self.tokens.acquire(estimate)
+        with self._lock:
+            self._reserved[run_id] = estimate
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            estimate = self._reserved.pop(run_id, 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if "total_tokens" in usage:
+            self.tokens.adjust(usage["total_tokens"] - estimate)
+        else:
+            # no usage reported (e.g. a cache hit): nothing was sent to the provider
+            self.tokens.adjust(-estimate)
+            self.requests.adjust(-1)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            estimate = self._reserved.pop(run_id, 0)
+        self.tokens.adjust(-estimate)
+
+
+def backoff_delay(attempt, base=BASE_RETRY_DELAY, cap=MAX_RETRY_DELAY):
+    """Exponential backoff with full jitter for the given 0-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+#*-----------------Checkpoint-----------------*#
+
+class Checkpoint:
+    """
+    Append-only JSONL log of finished items. Every record is flushed and fsynced
+    before the next one is written, so a crashed run loses at most the items that
+    were in flight; a torn final line is ignored on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def load(self):
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["key"]] = record
+        return records
+
+    def append(self, record):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            # start on a fresh line after a torn one, or the first record would be lost with it
+            if self._file.tell() > 0 and not self._ends_with_newline():
+                self._file.write("\n")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+#*-----------------Runner-----------------*#
+
+def _default_qa_factory():
+    from crewai_240721 import EmergencyRoomQA
+    # no per-task budgets: time spent waiting for the rate limiter would count against them
+    return EmergencyRoomQA(task_budgets=False)
+
+
+class BatchRunner:
+    """
+    Runs EmergencyRoomQA over many patients with bounded concurrency, rate
+    limiting, jittered retries and a resumable checkpoint. All worker threads
+    share one EmergencyRoomQA built with `qa_factory` on first use; it runs
+    every patient on its own crew instance. `rate_limiter` holds the large model
+    to its quota and `small_rate_limiter` the small routing model to its own.
+    """
+
+    def __init__(self, checkpoint_path, qa_factory=None, concurrency=4,
+                 max_retries=MAX_RETRIES, rate_limiter=None, retry_errors=False, small_rate_limiter=None):
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.qa_factory = qa_factory or _default_qa_factory
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        self.small_rate_limiter = small_rate_limiter
+        self.retry_errors = retry_errors
+        self._qa = None
+        self._qa_lock = threading.Lock()
+
+    def _get_qa(self):
+        if self._qa is None:
+            with self._qa_lock:
+                if self._qa is None:
+                    qa = self.qa_factory()
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.attach(qa.llm)
+                    if self.small_rate_limiter is not None:
+                        from crewai_240721 import get_small_llm
+
+                        self.small_rate_limiter.attach(get_small_llm())
+                    self._qa = qa
+        return self._qa
+
+    def _infer(self, text):
+        return self._get_qa().get_er_result(text)
+
+    async def _run_one(self, key, text, executor, semaphore):
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        error = None
+        for attempt in range(self.max_retries):
+            try:
+                async with semaphore:
+                    result = await loop.run_in_executor(executor, self._infer, text)
+                degraded = getattr(result, "degraded", None)
+                record = {"key": key, "status": "degraded" if degraded else "ok", "output": str(result),
+                          "attempts": attempt + 1, "elapsed": time.time() - started}
+                if hasattr(result, "to_record"):
+                    record["result"] = result.to_record()
+                if degraded and attempt < self.max_retries - 1:
+                    # best-effort answers are worth another try; the last one is kept as it is
+                    print(f"Row {key}: attempt {attempt + 1} degraded ({'; '.join(degraded)})")
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                return record
+            except Exception as e:
+                error = e
+                print(f"Row {key}: attempt {attempt + 1} failed: {e}")
+                # back off without holding a worker slot
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(backoff_delay(attempt))
+        return {"key": key, "status": "error", "output": f"Error after {self.max_retries} attempts: {error}",
+                "attempts": self.max_retries, "elapsed": time.time() - started}
+
+    async def arun(self, items):
+        """
+        Process `(key, text)` pairs and return {key: record} for every item,
+        including ones finished by earlier runs against the same checkpoint.
+        """
+        records = self.checkpoint.load()
+        done = {key for key, r in records.items() if r["status"] == "ok" or not self.retry_errors}
+        pending = [(key, text) for key, text in items if key not in done]
+        print(f"{len(done)} items already in checkpoint, {len(pending)} to process.")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="er-batch")
+        try:
+            jobs = [asyncio.ensure_future(self._run_one(key, text, executor, semaphore)) for key, text in pending]
+            for finished, job in enumerate(asyncio.as_completed(jobs), 1):
+                record = await job
+                self.checkpoint.append(record)
+                records[record["key"]] = record
+                print(f"[{finished}/{len(pending)}] row {record['key']}: {record['status']} "
+                      f"in {record['elapsed']:.1f}s")
+        finally:
+            executor.shutdown(wait=True)
+            self.checkpoint.close()
+        return records
+
+    def run(self, items):
+        return asyncio.run(self.arun(items))
+
+
+#*-----------------CLI-----------------*#
+
+def read_csv_with_encoding(file_path):
+    import pandas as pd
+
+    for encoding in ['utf-8', 'iso-8859-1', 'cp1252', 'latin1']:
+        try:
+            return pd.read_csv(file_path, encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Unable to read the file {file_path} with any of the attempted encodings.")
+
+
+def write_results(output_file, df, records, input_column="input"):
+    """One row per input row through a buffered JSONL/Parquet writer (er_result.open_writer)."""
+    from er_result import open_writer
+
+    columns = dict(key="int64", input="string", status="string", attempts="int64", elapsed="float64")
+    with open_writer(output_file, columns=columns) as writer:
+        for index, text in df[input_column].items():
+            record = records.get(int(index), {})
+            row = {
+                "key": int(index),
+                "input": text if isinstance(text, str) else None,
+                "status": record.get("status"),
+                "attempts": record.get("attempts"),
+                "elapsed": record.get("elapsed"),
+                "output": record.get("output", ""),
+            }
+            row.update(record.get("result") or {})
+            writer.write(row)
+
+
+def run_csv(input_file, output_file, checkpoint_path=None, input_column="input", **runner_kwargs):
+    """
+    Run every row of `input_file` and write the results to `output_file`: a .jsonl or
+    .parquet file gets one row per patient with the parsed result fields
+    (er_result.ERResult.to_record), anything else a copy of the CSV with an output column.
+    """
+    df = read_csv_with_encoding(input_file)
+    checkpoint_path = checkpoint_path or f"{os.path.splitext(output_file)[0]}.checkpoint.jsonl"
+    items = [(int(index), text) for index, text in df[input_column].items() if isinstance(text, str) and text.strip()]
+
+    records = BatchRunner(checkpoint_path, **runner_kwargs).run(items)
+
+    if os.path.splitext(output_file)[1].lower() in (".jsonl", ".parquet"):
+        write_results(output_file, df, records, input_column)
+        print(f"Final results saved to {output_file}")
+        return records
+
+    df["output"] = [records[int(i)]["output"] if int(i) in records else "" for i in df.index]
+    df.to_csv(output_file, index=False, encoding="utf-8")
+    print(f"Final results saved to {output_file}")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EmergencyRoomQA over a CSV of patient cases.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file", help=".csv, or .jsonl / .parquet for structured results")
+    parser.add_argument("--checkpoint", help="append-only JSONL checkpoint (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--input-column", default="input")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="LLM requests per minute")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="LLM tokens per minute")
+    parser.add_argument("--small-rpm", type=int, default=DEFAULT_SMALL_REQUESTS_PER_MINUTE,
+                        help="requests per minute of the small routing model")
+    parser.add_argument("--small-tpm", type=int, default=DEFAULT_SMALL_TOKENS_PER_MINUTE,
+                        help="tokens per minute of the small routing model")
+    parser.add_argument("--retry-errors", action="store_true", help="re-run items recorded as errors or degraded")
+    args = parser.parse_args(argv)
+
+    run_csv(
+        args.input_file,
+        args.output_file,
+        checkpoint_path=args.checkpoint,
+        input_column=args.input_column,
+        concurrency=args.concurrency,
+        max_retries=args.max_retries,
+        rate_limiter=GroqRateLimiter(args.rpm, args.tpm),
+        small_rate_limiter=GroqRateLimiter(args.small_rpm, args.small_tpm),
+        retry_errors=args.retry_errors,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,629 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Offline benchmark of the real EmergencyRoomQA crew (crewAI agents, TaskScheduler,
+# context compaction, instrumentation, search cache, RxNorm lookup) with the Groq model,
+# web search and RxNorm vector search replaced by simulated backends. Latency, token
+# counts and outputs of the fakes are configurable, so runs are free, repeatable and
+# measure what this repository adds on top of the network.
+#
+#   python benchmark.py --save-baseline     # record benchmark_baseline.json on the reference machine
+#   python benchmark.py --check             # exit 1 if any scenario regressed past --tolerance
+#
+# tests/test_benchmark.py runs a small zero-latency scenario against
+# tests/benchmark_baseline.json when crewAI is installed.
+
+DEFAULT_PATIENTS = (2, 8)
+DEFAULT_CONCURRENCY = (1, 4)
+DEFAULT_BASELINE = "./benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.2
+PERCENTILES = (50, 95, 99)
+CHARS_PER_TOKEN = 4
+STEP_MARKER = "[simulated step]"
+SMALL_MODEL_LATENCY = 0.3  # relative to the large model
+
+
+#*-----------------Simulated latency-----------------*#
+
+class Latency:
+    """Log-normal latency in seconds: `median` and spread `sigma`, every sample multiplied by `scale`."""
+
+    def __init__(self, median, sigma=0.25, scale=1.0):
+        self.median = median
+        self.sigma = sigma
+        self.scale = scale
+
+    @classmethod
+    def parse(cls, text, scale=1.0):
+        """'MEDIAN' or 'MEDIAN,SIGMA', e.g. '0.05,0.3'."""
+        median, _, sigma = text.partition(",")
+        return cls(float(median), float(sigma) if sigma else 0.25, scale)
+
+    def sample(self, rng):
+        if self.median <= 0 or self.scale <= 0:
+            return 0.0
+        return self.scale * self.median * math.exp(rng.gauss(0, self.sigma))
+
+
+class _Random:
+    """Seeded random source shared between threads."""
+
+    def __init__(self, seed):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self, latency):
+        with self._lock:
+            return latency.sample(self._rng)
+
+    def randint(self, low, high):
+        with self._lock:
+            return self._rng.randint(low, high)
+
+
+#*-----------------Canned outputs-----------------*#
+
+# Final answers in the formats each task's expected_output asks for, so context
+# compaction and the KTAS parsing see realistic reports.
+CANNED_REPORTS = dict(
+    medical_diagnosis = """PRIMARY DIAGNOSIS: Community-acquired pneumonia
+
+Supporting Evidence: Fever, productive cough, dyspnea and focal crackles on auscultation.
+
+Differential Diagnoses:
+1. Acute bronchitis: cough without consolidation
+2. Pulmonary embolism: dyspnea with tachycardia
+3. Acute heart failure: dyspnea with crackles
+
+Treatment Plan:
+1. Medications:
+   a. Ceftriaxone 1 g IV q24h - empirical coverage (RxNorm verified)
+   b. Azithromycin 500 mg PO q24h - atypical coverage (RxNorm verified)
+2. Interventions/Procedures: Supplemental oxygen to SpO2 >= 94%
+3. Fluid Management: Normal saline 1 L over 2 hours
+4. Pain Management: Acetaminophen 1 g PO q6h as needed
+
+Diagnostic Tests:
+1. Chest X-ray: confirm consolidation
+2. CBC, CRP, blood cultures: severity and pathogen
+
+Potential Complications:
+1. Sepsis: hypotension, lactate > 2 mmol/L - start sepsis bundle
+2. Respiratory failure: rising oxygen requirement - consider ICU
+
+Consultations:
+1. Pulmonology: if no improvement within 48 hours
+
+Monitoring Plan: Vital signs every hour, SpO2 continuously, reassess in 4 hours.
+
+Evidence-Based Guidelines: ATS/IDSA community-acquired pneumonia guideline.""",
+    medication_review = """MEDICATION SAFETY REPORT
+
+Patient Condition Summary: Adult with community-acquired pneumonia, normal renal function.
+
+Prescribed Medications Analysis:
+1. Ceftriaxone (RxNorm verified):
+   - Dose/Route/Frequency: 1 g IV q24h
+   - Indication: pneumonia
+   - Appropriateness: appropriate
+   - Interactions: none significant
+   - Contraindications: severe beta-lactam allergy
+   - Administration Instructions: infuse over 30 minutes
+   - Monitoring: rash, diarrhea
+
+2. Azithromycin (RxNorm verified):
+   - Dose/Route/Frequency: 500 mg PO q24h
+   - Indication: atypical coverage
+   - Appropriateness: appropriate
+   - Interactions: QT-prolonging drugs
+   - Contraindications: known QT prolongation
+   - Administration Instructions: with or without food
+   - Monitoring: ECG if on other QT-prolonging drugs
+
+Overall Medication Therapy Assessment:
+- Drug-Disease Interactions: none
+- High-Alert Medications: none
+- Pharmacokinetic Considerations: no renal adjustment needed
+
+Recommendations:
+1. Obtain baseline ECG before azithromycin
+2. Switch to oral therapy when clinically stable
+
+Emergency Pharmacology Considerations:
+- Confirm allergy history before the first ceftriaxone dose
+
+References:
+- ATS/IDSA community-acquired pneumonia guideline""",
+    triage_assessment = """KTAS CLASSIFICATION: 3
+
+Detailed Justification: Dyspnea with SpO2 above 90% and fever; may progress and needs emergency evaluation.
+
+Patient Assessment:
+1. Presenting Symptoms: fever, productive cough, dyspnea
+2. Vital Signs: BP 128/76, HR 104, RR 24, T 38.6, SpO2 93%
+3. Medical History: hypertension
+4. Medications and Allergies: amlodipine; no known allergies
+5. Pain Assessment: 3/10 pleuritic chest pain
+6. Mental Status: alert and oriented
+
+Critical Findings: Borderline hypoxemia.
+
+Recommended Actions: Oxygen, chest X-ray, blood cultures before antibiotics.
+
+Additional Information: None.""",
+    er_management_decision = """EMERGENCY DEPARTMENT MANAGEMENT DECISION
+
+KTAS Classification Review: KTAS 3, accurate.
+
+Clinical Assessment:
+- Primary Diagnosis: Agree with community-acquired pneumonia
+- Critical Findings: Borderline hypoxemia
+
+Disposition Decision: Admit
+
+Justification:
+CURB-65 of 1 with oxygen requirement; ward admission for IV antibiotics and monitoring.
+
+Management Plan:
+1. Immediate Actions: Oxygen, blood cultures, first antibiotic dose
+2. Medications: Ceftriaxone and azithromycin as reviewed by pharmacy
+3. Diagnostic Tests: Chest X-ray, CBC, CRP, lactate
+4. Consultations: None required now
+5. Monitoring: Vital signs every 2 hours, SpO2 continuously
+
+Resource Allocation:
+General medical ward bed.
+
+Communication Plan:
+- Patient/Family: Diagnosis, admission and expected course
+- Healthcare Team: Handover to admitting medical team
+
+Contingency Planning:
+Escalate to ICU if SpO2 < 90% on 6 L/min or systolic BP < 90 mmHg.
+
+Additional Considerations:
+None.
+
+References:
+ATS/IDSA community-acquired pneumonia guideline""",
+)
+
+# task -> [(tool name, query)] the simulated agent calls before answering
+TOOL_CALLS = dict(
+    medical_diagnosis = [("DuckDuckGoSearch", "community acquired pneumonia treatment guideline")],
+    medication_review = [("RxNorm Lookup", "ceftriaxone"), ("RxNorm Lookup", "azithromycin 500 mg")],
+    triage_assessment = [],
+    er_management_decision = [("RxNorm Lookup", "ceftriaxone")],
+)
+
+SAMPLE_CASES = [
+    "65-year-old man with fever of 38.6, productive cough and shortness of breath for 3 days. BP 128/76, HR 104, RR 24, SpO2 93% on room air.",
+    "42-year-old woman with crushing chest pain radiating to the left arm for 40 minutes, diaphoresis. BP 150/90, HR 110.",
+    "8-year-old boy with diarrhea and vomiting since yesterday, temperature 38.2, tolerating fluids poorly.",
+    "30-year-old man with a 3 cm laceration on the left forearm from a kitchen knife, bleeding controlled. Vital signs normal.",
+]
+
+RXNORM_ROWS = [
+    dict(RXCUI="1665021", STR="ceftriaxone 1000 MG Injection", TTY="SCD"),
+    dict(RXCUI="2472", STR="ceftriaxone", TTY="IN"),
+    dict(RXCUI="308460", STR="azithromycin 250 MG Oral Tablet", TTY="SCD"),
+    dict(RXCUI="161", STR="acetaminophen", TTY="IN"),
+]
+
+
+#*-----------------Simulated LLM-----------------*#
+
+class SimulatedLLM:
+    """
+    What the fake chat model answers: for each task, the tool calls in TOOL_CALLS one
+    per LLM call, then its canned report as the final answer. Each call sleeps for a
+    sampled time-to-first-token plus completion_tokens / tokens_per_second.
+    """
+
+    def __init__(self, reports=None, tool_calls=None, latency=None, tokens_per_second=5000.0,
+                 completion_tokens=(300, 700), roles=None, seed=0):
+        self.reports = dict(CANNED_REPORTS, **(reports or {}))
+        self.tool_calls = dict(TOOL_CALLS, **(tool_calls or {}))
+        self.latency = latency or Latency(0.05, 0.3)
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.roles = roles or {}  # task -> agent role, to recognize a task from its prompt
+        self._random = _Random(seed)
+
+    def task_of(self, prompt):
+        from instrumentation import current_task
+
+        task = current_task()
+        if task:
+            return task
+        for name, role in self.roles.items():
+            if f"You are {role}" in prompt:
+                return name
+        return ""
+
+    def respond(self, prompt):
+        """(text, token usage, delay in seconds) for one LLM call."""
+        task = self.task_of(prompt)
+        calls = self.tool_calls.get(task, [])
+        step = prompt.count(STEP_MARKER)
+        if step < len(calls):
+            tool, query = calls[step]
+            text = (
+                f"Thought: {STEP_MARKER} I should use a tool.\n"
+                f"Action: {tool}\n"
+                f"Action Input: {json.dumps(dict(search_query=query))}"
+            )
+        else:
+            report = self.reports.get(task, "No report.")
+            text = f"Thought: I now know the final answer\nFinal Answer: {report}"
+        completion_tokens = self._random.randint(*self.completion_tokens)
+        usage = dict(
+            prompt_tokens=len(prompt) // CHARS_PER_TOKEN,
+            completion_tokens=completion_tokens,
+            total_tokens=len(prompt) // CHARS_PER_TOKEN + completion_tokens,
+        )
+        delay = self._random.latency(self.latency)
+        if self.tokens_per_second and self.latency.scale > 0:
+            delay += self.latency.scale * completion_tokens / self.tokens_per_second
+        return text, usage, delay
+
+
+class FakeChatModel(BaseChatModel):
+    """LangChain chat model that answers from a SimulatedLLM instead of calling Groq."""
+
+    sim: Any = None
+    model_name: str = "simulated-llama3-70b"
+    latency_factor: float = 1.0  # e.g. < 1 for the small routing tier
+
+    @property
+    def _llm_type(self):
+        return "simulated-chat"
+
+    @property
+    def _identifying_params(self):
+        return dict(model_name=self.model_name)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text, usage, delay = self.sim.respond(prompt)
+        time.sleep(delay * self.latency_factor)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output=dict(token_usage=usage, model_name=self.model_name),
+        )
+
+
+#*-----------------Simulated tools-----------------*#
+
+class SimulatedSearchBackend:
+    """web_search backend that sleeps for a sampled latency and returns a fixed snippet."""
+
+    def __init__(self, latency=None, seed=1):
+        self.latency = latency or Latency(0.1, 0.5)
+        self._random = _Random(seed)
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        time.sleep(self._random.latency(self.latency))
+        return f"{query}: guideline summary (simulated search result)."
+
+
+class SimulatedRxNormTool:
+    """Stand-in for the RxNorm vector search tool: sampled latency, fixed rows."""
+
+    def __init__(self, latency=None, seed=2):
+        self.latency = latency or Latency(0.03, 0.3)
+        self._random = _Random(seed)
+        self.calls = 0
+
+    def run(self, search_query):
+        from rxnorm_index import format_rows
+
+        self.calls += 1
+        time.sleep(self._random.latency(self.latency))
+        return format_rows(RXNORM_ROWS[:2])
+
+
+def install(llm=None, search=None, rxnorm=None):
+    """
+    Point crewai_240721's shared LLM, web search and RxNorm backends at simulated ones.
+    Everything else (agents, tasks, tools, scheduler, caches) is the real code.
+    """
+    import crewai_240721 as er
+    from deadlines import attach_deadlines
+    from instrumentation import instrument_llm
+    from rxnorm_lookup import RxNormLookup
+    from web_search import CachedSearch
+
+    er.configure()
+    llm = llm or SimulatedLLM()
+    if not llm.roles:
+        llm.roles = {name: er.AGENT_TEMPLATES[t.agent].role for name, t in er.TASK_TEMPLATES.items()}
+    er.get_llm.set(attach_deadlines(instrument_llm(FakeChatModel(sim=llm))))
+    er.get_small_llm.set(attach_deadlines(instrument_llm(
+        FakeChatModel(sim=llm, model_name="simulated-llama3-8b", latency_factor=SMALL_MODEL_LATENCY)
+    )))
+    er.get_web_search.set(CachedSearch(search or SimulatedSearchBackend()))
+    er.get_rxnorm_index.set(None)
+    er.get_rxnorm_tool.set(rxnorm or SimulatedRxNormTool())
+    er.get_rxnorm_lookup.set(RxNormLookup(RXNORM_ROWS, "RXCUI", "STR"))
+    return er
+
+
+def uninstall():
+    import crewai_240721 as er
+    er.configure()
+
+
+#*-----------------Measurement-----------------*#
+
+def percentile(values, q):
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _distribution(values):
+    stats = {f"p{q}": percentile(values, q) for q in PERCENTILES}
+    stats["count"] = len(values)
+    return stats
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def stage_latencies(traces):
+    """
+    {stage: [seconds]} from request traces: one stage per task, 'llm', 'tool:<name>',
+    and 'overhead' - task time not spent in LLM or tool calls, i.e. crewAI and this repo.
+    """
+    stages = {}
+    for trace in traces:
+        inner = {}
+        for span in trace.spans:
+            if span["kind"] == "task":
+                stages.setdefault(f"task:{span['task']}", []).append(span["duration"])
+                continue
+            stage = "llm" if span["kind"] == "llm" else f"tool:{span['name']}"
+            stages.setdefault(stage, []).append(span["duration"])
+            inner[span["task"]] = inner.get(span["task"], 0.0) + span["duration"]
+        for span in trace.spans:
+            if span["kind"] == "task":
+                stages.setdefault("overhead", []).append(max(0.0, span["duration"] - inner.get(span["task"], 0.0)))
+    return stages
+
+
+def _run_patient(qa, request_id, symptoms):
+    provisional = qa.run_pre_triage(symptoms)
+    crew = qa.new_crew(request_id, provisional=provisional)
+    crew.run({"input": symptoms})
+    return crew.trace
+
+
+def run_scenario(qa, patients, concurrency, trace_memory=False):
+    """Run `patients` simulated cases through `qa`, `concurrency` at a time."""
+    import tracemalloc
+
+    cases = [
+        (f"bench-{patients}-{concurrency}-{i}", f"{SAMPLE_CASES[i % len(SAMPLE_CASES)]} (patient {i})")
+        for i in range(patients)
+    ]
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        traces = list(pool.map(lambda case: _run_patient(qa, *case), cases))
+    wall = time.perf_counter() - start
+
+    result = dict(
+        patients=patients,
+        concurrency=concurrency,
+        wall_seconds=wall,
+        throughput=patients / wall,
+        request=_distribution([trace.duration for trace in traces]),
+        stages={stage: _distribution(values) for stage, values in sorted(stage_latencies(traces).items())},
+        peak_rss_mb=_peak_rss_mb(),
+    )
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return result
+
+
+def scenario_key(patients, concurrency):
+    return f"patients={patients},concurrency={concurrency}"
+
+
+def run_benchmark(patients=DEFAULT_PATIENTS, concurrency=DEFAULT_CONCURRENCY, llm=None, search=None,
+                  rxnorm=None, parallel=True, trace_memory=False, quiet=True):
+    """Run every patients x concurrency scenario against the simulated backends; returns {scenario: result}."""
+    er = install(llm, search, rxnorm)
+    results = {}
+    try:
+        # no memo: scenarios reuse the same cases and would measure cache hits
+        qa = er.EmergencyRoomQA(parallel=parallel, memo=False)
+        # crewAI agents are verbose; printing would dominate the measured overhead
+        output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+        with output:
+            _run_patient(qa, "bench-warmup", SAMPLE_CASES[0])
+            for p in patients:
+                for c in concurrency:
+                    results[scenario_key(p, c)] = run_scenario(qa, p, c, trace_memory)
+    finally:
+        uninstall()
+    return results
+
+
+#*-----------------Baselines-----------------*#
+
+# (metric path, higher is better, smallest absolute change that counts)
+CHECKED_METRICS = [
+    ("throughput", True, 0.0),
+    ("request.p95", False, 0.01),
+    ("stages.overhead.p95", False, 0.005),
+    ("peak_rss_mb", False, 16.0),
+]
+
+
+def _metric(result, path):
+    value = result
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def environment():
+    try:
+        from importlib.metadata import version
+        crewai_version = version("crewai")
+    except Exception:
+        crewai_version = None
+    return dict(python=platform.python_version(), platform=platform.platform(), crewai=crewai_version)
+
+
+def save_baseline(results, path, settings):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(environment=environment(), settings=settings, scenarios=results), f, indent=2)
+        f.write("\n")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Lines describing every checked metric that is worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline["scenarios"].get(key)
+        if reference is None:
+            continue
+        for path, higher_is_better, min_delta in CHECKED_METRICS:
+            old, new = _metric(reference, path), _metric(result, path)
+            if old is None or new is None or old <= 0:
+                continue
+            change = (old - new) if higher_is_better else (new - old)
+            if change > min_delta and change / old > tolerance:
+                regressions.append(f"{key} {path}: {old:.4g} -> {new:.4g} ({change / old:+.0%} worse)")
+    return regressions
+
+
+def format_results(results):
+    header = f"{'scenario':<30}{'wall s':>9}{'pat/s':>8}{'req p50':>9}{'req p95':>9}{'ovh p95':>9}{'rss MB':>9}"
+    lines = [header, "-" * len(header)]
+    for key, r in results.items():
+        overhead = _metric(r, "stages.overhead.p95")
+        lines.append(
+            f"{key:<30}{r['wall_seconds']:>9.2f}{r['throughput']:>8.2f}{r['request']['p50']:>9.3f}"
+            f"{r['request']['p95']:>9.3f}{(overhead or 0.0):>9.4f}{(r['peak_rss_mb'] or 0.0):>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+#*-----------------CLI-----------------*#
+
+def _ints(text):
+    return tuple(int(value) for value in text.split(","))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline EmergencyRoomQA benchmark with a simulated LLM and tools.")
+    parser.add_argument("--patients", type=_ints, default=DEFAULT_PATIENTS, help="comma-separated patient counts")
+    parser.add_argument("--concurrency", type=_ints, default=DEFAULT_CONCURRENCY, help="comma-separated concurrency levels")
+    parser.add_argument("--sequential", action="store_true", help="run each crew's tasks one at a time")
+    parser.add_argument("--llm-latency", default="0.05,0.3", help="LLM time to first token: MEDIAN[,SIGMA] seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=5000.0)
+    parser.add_argument("--completion-tokens", type=_ints, default=(300, 700), help="MIN,MAX completion tokens per call")
+    parser.add_argument("--search-latency", default="0.1,0.5", help="MEDIAN[,SIGMA] seconds")
+    parser.add_argument("--rxnorm-latency", default="0.03,0.3", help="MEDIAN[,SIGMA] seconds")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every simulated latency (0 = pure overhead)")
+    parser.add_argument("--outputs", help="JSON file {task: report} overriding the canned reports")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="also report peak Python allocations (slower)")
+    parser.add_argument("--verbose", action="store_true", help="keep crewAI's console output")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a scenario regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.check and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save-baseline.")
+        return 2
+
+    reports = None
+    if args.outputs:
+        with open(args.outputs, encoding="utf-8") as f:
+            reports = json.load(f)
+    scale = args.latency_scale
+    llm = SimulatedLLM(
+        reports=reports,
+        latency=Latency.parse(args.llm_latency, scale),
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+    results = run_benchmark(
+        patients=args.patients,
+        concurrency=args.concurrency,
+        llm=llm,
+        search=SimulatedSearchBackend(Latency.parse(args.search_latency, scale), seed=args.seed + 1),
+        rxnorm=SimulatedRxNormTool(Latency.parse(args.rxnorm_latency, scale), seed=args.seed + 2),
+        parallel=not args.sequential,
+        trace_memory=args.trace_memory,
+        quiet=not args.verbose,
+    )
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    settings = {name: value for name, value in vars(args).items()
+                if name not in ("baseline", "save_baseline", "check", "tolerance", "json", "verbose")}
+    if args.save_baseline:
+        save_baseline(results, args.baseline, settings)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != json.loads(json.dumps(settings)):
+            print("Warning: baseline was recorded with different settings.")
+        if baseline.get("environment") != environment():
+            print("Warning: baseline was recorded on a different environment.")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Performance regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
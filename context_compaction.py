@@ -0,0 +1,256 @@
+import functools
+import re
+
+# Downstream tasks get the structured fields they need from upstream reports instead of
+# the full markdown. Fields are pulled out of the section headers that each task's
+# expected_output asks for; when a report does not follow its format the raw text is
+# passed on, truncated, so no upstream output is ever dropped entirely. The pharmacist's
+# medications and the physician's treatment plan are compacted per drug rather than cut
+# at a character count.
+
+MAX_FIELD_CHARS = 600
+MAX_FALLBACK_CHARS = 2000
+
+# task name -> {field: header regex}, in the order the headers appear in the report
+REPORT_FIELDS = dict(
+    medical_diagnosis = dict(
+        primary_diagnosis = r"PRIMARY DIAGNOSIS",
+        supporting_evidence = r"Supporting Evidence",
+        differential_diagnoses = r"Differential Diagnoses",
+        treatment_plan = r"Treatment Plan",
+        diagnostic_tests = r"Diagnostic Tests",
+        complications = r"Potential Complications",
+        consultations = r"Consultations",
+        monitoring = r"Monitoring Plan",
+        guidelines = r"Evidence-Based Guidelines",
+    ),
+    medication_review = dict(
+        report = r"MEDICATION SAFETY REPORT",
+        condition_summary = r"Patient Condition Summary",
+        medications = r"Prescribed Medications Analysis",
+        therapy_assessment = r"Overall Medication Therapy Assessment",
+        recommendations = r"Recommendations",
+        er_considerations = r"Emergency Pharmacology Considerations",
+        references = r"References",
+    ),
+    triage_assessment = dict(
+        ktas_level = r"KTAS CLASSIFICATION",
+        justification = r"Detailed Justification",
+        patient_assessment = r"Patient Assessment",
+        critical_findings = r"Critical Findings",
+        recommended_actions = r"Recommended Actions",
+        additional_information = r"Additional Information",
+    ),
+    er_management_decision = dict(
+        ktas_review = r"KTAS Classification Review",
+        clinical_assessment = r"Clinical Assessment",
+        disposition = r"Disposition Decision",
+        justification = r"Justification",
+        management_plan = r"Management Plan",
+        resource_allocation = r"Resource Allocation",
+        communication_plan = r"Communication Plan",
+        contingency = r"Contingency Planning",
+        additional_considerations = r"Additional Considerations",
+        references = r"References",
+    ),
+)
+
+# downstream task -> {upstream task: fields it needs}
+CONTEXT_FIELDS = dict(
+    triage_assessment = dict(
+        medical_diagnosis = ("primary_diagnosis", "differential_diagnoses", "treatment_plan"),
+        medication_review = ("medications", "therapy_assessment", "recommendations"),
+    ),
+    er_management_decision = dict(
+        triage_assessment = ("ktas_level", "justification", "critical_findings", "recommended_actions"),
+        medical_diagnosis = ("primary_diagnosis", "differential_diagnoses", "treatment_plan",
+                             "diagnostic_tests", "complications", "consultations"),
+        medication_review = ("medications", "therapy_assessment", "recommendations"),
+    ),
+)
+
+# per-drug details of the pharmacist's medications section kept for downstream tasks
+DRUG_DETAILS = dict(
+    dose = r"Dose(?:\s*/\s*Route)?(?:\s*/\s*Frequency)?",
+    interactions = r"(?:Drug[- ])?Interactions?",
+    contraindications = r"Contraindications?",
+)
+MAX_DRUG_DETAIL_CHARS = 200
+
+# report fields a task's output must contain to count as a complete report
+REQUIRED_FIELDS = dict(
+    medical_diagnosis = ("primary_diagnosis", "treatment_plan"),
+    medication_review = ("medications", "recommendations"),
+    triage_assessment = ("ktas_level", "justification"),
+    er_management_decision = ("disposition",),
+)
+
+_HEADER_PREFIX = r"^[ \t>#*_\-\d.]*"
+_HEADER_SUFFIX = r"[ \t*_]*(?::|$)[ \t*_]*"
+
+
+def _compile(fields):
+    alternatives = "|".join(f"(?P<{name}>{pattern})" for name, pattern in fields.items())
+    return re.compile(_HEADER_PREFIX + f"(?:{alternatives})" + _HEADER_SUFFIX, re.IGNORECASE | re.MULTILINE)
+
+
+_REPORT_PATTERNS = {task: _compile(fields) for task, fields in REPORT_FIELDS.items()}
+
+
+#*-----------------Extraction-----------------*#
+
+def extract_fields(task, text):
+    """{field: section text} for every known section header of `task` found in its report."""
+    pattern = _REPORT_PATTERNS.get(task)
+    if pattern is None or not text:
+        return {}
+    matches = list(pattern.finditer(text))
+    fields = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following is not None else len(text)
+        value = text[match.end():end].strip(" \t\r\n*_")
+        fields.setdefault(match.lastgroup, value)
+    return fields
+
+
+def missing_fields(task, text, required=None):
+    """REQUIRED_FIELDS (or `required`) of `task` that `text` does not contain."""
+    fields = extract_fields(task, text)
+    return [name for name in (REQUIRED_FIELDS.get(task, ()) if required is None else required) if not fields.get(name)]
+
+
+_ACTION_RE = re.compile(r"\n\s*Action\s*\d*\s*:", re.IGNORECASE)
+
+
+def report_body(task, text):
+    """`text` from its first section header of `task` on, without a trailing ReAct Action; else all of it."""
+    pattern = _REPORT_PATTERNS.get(task)
+    match = pattern.search(text) if pattern is not None and text else None
+    body = text[match.start():] if match else (text or "")
+    return _ACTION_RE.split(body)[0].strip()
+
+
+def _squeeze(text, limit):
+    text = re.sub(r"[ \t]+", " ", re.sub(r"\n\s*\n+", "\n", text)).strip()
+    return text if len(text) <= limit else text[:limit].rstrip() + " ..."
+
+
+_DRUG_ENTRY_RE = re.compile(r"^[ \t*_]*\d+\.[ \t]+", re.MULTILINE)
+_DRUG_DETAIL_RE = re.compile(
+    r"^[ \t]*(?:[-*•]|[a-z]\.)?[ \t*_]*(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in DRUG_DETAILS.items())
+    + r")[ \t*_]*:[ \t*_]*(?P<value>.*)$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def compact_medications(text):
+    """
+    One line per drug of a medications section: its name plus dose, interactions and
+    contraindications. Every drug is kept however many there are; a section without
+    numbered drug entries is passed on whole.
+    """
+    entries = _DRUG_ENTRY_RE.split(text)[1:]
+    if not entries:
+        return _squeeze(text, len(text))
+    lines = []
+    for entry in entries:
+        name = entry.split("\n")[0].replace("(RxNorm verified)", "").strip(" \t*_:")
+        details = [
+            f"{next(name for name in DRUG_DETAILS if match.group(name))} {_squeeze(match.group('value'), MAX_DRUG_DETAIL_CHARS)}"
+            for match in _DRUG_DETAIL_RE.finditer(entry)
+            if match.group("value").strip()
+        ]
+        lines.append(f"- {name}" + (f": {'; '.join(details)}" if details else ""))
+    return "\n" + "\n".join(lines)
+
+
+_PLAN_ITEM_RE = re.compile(r"^(?:[-*•]|[a-z][.)])\s", re.IGNORECASE)
+
+
+def compact_treatment_plan(text):
+    """
+    A treatment plan with every line kept: each drug (a lettered or bulleted item) cut at
+    MAX_DRUG_DETAIL_CHARS and every other line at MAX_FIELD_CHARS, so the later drugs and
+    the interventions after them reach the ER Doctor in Charge.
+    """
+    lines = []
+    for line in text.replace("(RxNorm verified)", "").splitlines():
+        line = line.strip()
+        if line:
+            lines.append(_squeeze(line, MAX_DRUG_DETAIL_CHARS if _PLAN_ITEM_RE.match(line) else MAX_FIELD_CHARS))
+    return "\n" + "\n".join(lines)
+
+
+# (task, field) -> compactor replacing the character cap for that field
+FIELD_COMPACTORS = {
+    ("medication_review", "medications"): compact_medications,
+    ("medical_diagnosis", "treatment_plan"): compact_treatment_plan,
+}
+
+
+def _compact_field(task, field, value):
+    compactor = FIELD_COMPACTORS.get((task, field))
+    return compactor(value) if compactor is not None else _squeeze(value, MAX_FIELD_CHARS)
+
+
+def compact_report(task, text, fields):
+    """The requested `fields` of `task`'s report as 'FIELD: value' lines, or its truncated raw text."""
+    extracted = extract_fields(task, text)
+    lines = [
+        f"{field.upper()}: {_compact_field(task, field, extracted[field])}"
+        for field in fields
+        if extracted.get(field)
+    ]
+    if not lines:
+        return _squeeze(text or "", MAX_FALLBACK_CHARS)
+    return "\n".join(lines)
+
+
+def compact_context(task, upstream):
+    """
+    Context for `task` from `upstream` [(task_name, output)], keeping only the fields
+    listed in CONTEXT_FIELDS. Upstream tasks without an entry are passed through whole.
+    """
+    needed = CONTEXT_FIELDS.get(task, {})
+    parts = []
+    for name, output in upstream:
+        body = compact_report(name, output, needed[name]) if name in needed else output
+        parts.append(f"[{name}]\n{body}")
+    return "\n\n".join(parts)
+
+
+#*-----------------Token accounting-----------------*#
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    """
+    Token count of `text`. Llama 3 uses a tiktoken BPE, so cl100k_base is a close
+    stand-in when tiktoken is available; otherwise ~4 characters per token.
+    """
+    try:
+        encoding = _encoding()
+    except (ImportError, OSError):
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def format_token_report(rows):
+    """Plain-text table of the per-task rows recorded by CrewInstance.token_report."""
+    header = f"{'task':<24}{'raw ctx':>10}{'compact ctx':>13}{'saved':>8}{'prompt':>9}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        saved = row["raw_context_tokens"] - row["context_tokens"]
+        lines.append(
+            f"{row['task']:<24}{row['raw_context_tokens']:>10}{row['context_tokens']:>13}"
+            f"{saved:>8}{row['prompt_tokens']:>9}"
+        )
+    raw = sum(row["raw_context_tokens"] for row in rows)
+    compact = sum(row["context_tokens"] for row in rows)
+    lines.append("-" * len(header))
+    lines.append(f"{'total':<24}{raw:>10}{compact:>13}{raw - compact:>8}{sum(r['prompt_tokens'] for r in rows):>9}")
+    return "\n".join(lines)
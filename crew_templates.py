@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+
+# Templates are immutable and hold no crewAI objects, so they can be shared freely
+# between threads; build() turns them into fresh Agent/Task instances per request.
+
+@dataclass(frozen=True)
+class AgentTemplate:
+    role: str
+    goal: str
+    backstory: str
+    tools: tuple = ()  # names of entries in crewai_240721.TOOLS
+    max_iter: int = 5
+    allow_delegation: bool = False
+    verbose: bool = True
+
+    def __post_init__(self):
+        object.__setattr__(self, "tools", tuple(self.tools))
+
+    def build(self, llm, tools, step_callback=None):
+        from crewai import Agent
+
+        return Agent(
+            role = self.role,
+            goal = self.goal,
+            backstory = self.backstory,
+            tools = list(tools),
+            llm = llm,
+            max_iter = self.max_iter,
+            allow_delegation = self.allow_delegation,
+            verbose = self.verbose,
+            step_callback = step_callback,
+        )
+
+
+@dataclass(frozen=True)
+class TaskTemplate:
+    description: str
+    expected_output: str
+    agent: str  # name of an AgentTemplate
+    context: tuple = ()  # names of upstream TaskTemplates
+    output_file: str = None
+    time_budget: float = None  # seconds, see deadlines.py
+    max_tool_calls: int = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "context", tuple(self.context))
+
+    def build(self, agent, context=(), output_file=None):
+        from crewai import Task
+
+        kwargs = dict(
+            description = self.description,
+            expected_output = self.expected_output,
+            agent = agent,
+        )
+        if context:
+            kwargs["context"] = list(context)
+        if output_file:
+            kwargs["output_file"] = output_file
+        return Task(**kwargs)
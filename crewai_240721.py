@@ -1,67 +1,250 @@
 # https://www.youtube.com/watch?v=-59bKxwir5Q
 
+import functools
+import logging
 import os
+import threading
+import uuid
+from collections import OrderedDict
 from dotenv import load_dotenv, find_dotenv
 _ = load_dotenv(find_dotenv())
 
-GROQ_API_KEY = os.environ['GROQ_API_KEY']
+logger = logging.getLogger(__name__)
 
-from crewai import Agent, Task, Crew
-from crewai_tools import tool, CSVSearchTool
-
-from langchain_community.tools import DuckDuckGoSearchRun
 # pip install --upgrade --quiet  duckduckgo-search
+#pip install sentence-transformers
+
+from crew_templates import AgentTemplate, TaskTemplate
+from task_scheduler import TaskScheduler, execute_task, join_context
+
+# Importing this module is cheap: crewAI, the Groq client, the embedder and the RxNorm
+# indexes are only imported/built by the get_*() factories below, on first use, and are
+# then shared by everything in the process. The old module globals (llm, RxNorm_tool,
+# search_tool, triage_nurse, medical_diagnosis, ...) still resolve, lazily, through
+# the module __getattr__ at the bottom of this file.
+
+#*-----------------Config-----------------*#
+
+CONFIG = dict(
+    model_name = "Llama3-70b-8192",
+    small_model_name = "llama3-8b-8192",  # routine stages, see model_routing.py
+    temperature = 0.2,
+    rxnorm_csv = "./RXNORM_cut.csv",
+    rxnorm_embedder = "BAAI/bge-small-en-v1.5",
+    rxnorm_llm = "llama3-8b-8192",  # only summarizes the retrieved rows
+    search_cache = os.getenv('ER_SEARCH_CACHE'),
+    llm_timeout = 60,  # seconds per LLM HTTP request
+)
+
+_factories = []
+
+
+def _lazy(factory):
+    """
+    Memoize a zero-argument factory per process; the first caller builds, the rest wait.
+    `.reset()` drops the value and `.set(value)` replaces it, e.g. with an offline fake.
+    """
+    lock = threading.Lock()
+    missing = object()
+    value = missing
+
+    @functools.wraps(factory)
+    def get():
+        nonlocal value
+        if value is missing:
+            with lock:
+                if value is missing:
+                    value = factory()
+        return value
+
+    def reset():
+        nonlocal value
+        with lock:
+            value = missing
+
+    def set(new_value):
+        nonlocal value
+        with lock:
+            value = new_value
+
+    get.reset = reset
+    get.set = set
+    _factories.append(get)
+    return get
+
+
+def configure(**overrides):
+    """Update CONFIG and drop every memoized object so the next use rebuilds it."""
+    unknown = set(overrides) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+    CONFIG.update(overrides)
+    for get in _factories:
+        get.reset()
 
-from groq import Groq
-from langchain_groq import ChatGroq
-from langchain_anthropic import ChatAnthropic
 
 #*-----------------LLM-----------------*#
 
-llm = ChatGroq(temperature=0.2,
-               #format="json",
-               model_name="Llama3-70b-8192",
-               api_key=os.getenv('GROQ_API_KEY'))
+def _build_llm(model_name):
+    from langchain_groq import ChatGroq
+    from llm_cache import cache_from_env, with_cache
+    from instrumentation import instrument_llm
+    from deadlines import attach_deadlines
+
+    llm = ChatGroq(temperature=CONFIG["temperature"],
+                   #format="json",
+                   model_name=model_name,
+                   timeout=CONFIG["llm_timeout"],
+                   api_key=os.environ['GROQ_API_KEY'])
+
+    # Optional on-disk response cache shared by all agents, e.g.
+    #   ER_LLM_CACHE=./.llm_cache.sqlite ER_LLM_CACHE_MODE=replay
+    # replays a recorded evaluation run offline and fails on any prompt not seen before.
+    cache = cache_from_env()
+    if cache is not None:
+        with_cache(llm, cache)
+    # per-request traces and aggregate metrics for every LLM call (instrumentation.py),
+    # and task time budgets checked before every call (deadlines.py)
+    return attach_deadlines(instrument_llm(llm))
+
+
+@_lazy
+def get_llm():
+    return _build_llm(CONFIG["model_name"])
+
+
+@_lazy
+def get_small_llm():
+    return _build_llm(CONFIG["small_model_name"])
+
+
+def get_tier_llm(tier):
+    """The shared LLM for a model_routing tier (SMALL or LARGE)."""
+    from model_routing import SMALL
+    return get_small_llm() if tier == SMALL else get_llm()
 
 
 
 #*-----------------Tools-----------------*#
 
+@_lazy
+def get_rxnorm_index():
+    """The prebuilt memory-mapped index for the current CSV (`python rxnorm_index.py build`), or None."""
+    from rxnorm_index import RxNormIndex
+    try:
+        return RxNormIndex.open(CONFIG["rxnorm_csv"], embedder=CONFIG["rxnorm_embedder"])
+    except FileNotFoundError:
+        return None
 
-RxNorm_tool = CSVSearchTool(csv = "./RXNORM_cut.csv", 
-    config=dict(
-        llm=dict(
-            provider="groq", # or google, openai, anthropic, llama2, ...
-            config=dict(
-                model="llama3-70b-8192",
-                # temperature=0.5,
-                # top_p=1,
-                # stream=true,
+
+@_lazy
+def get_rxnorm_tool():
+    from crewai_tools import tool, CSVSearchTool
+    from rxnorm_index import format_rows
+
+    # Prefer the prebuilt index; it is shared read-only across worker processes and
+    # skips embedding the CSV at startup.
+    index = get_rxnorm_index()
+    if index is not None:
+        @tool('RxNorm Search')
+        def rxnorm_search(search_query: str):
+            """Search the RxNorm database (RXCUI, drug names and term types) for drugs matching the query"""
+            return format_rows(index.search(search_query, k=5))
+        return rxnorm_search
+
+    return CSVSearchTool(csv = CONFIG["rxnorm_csv"],
+        config=dict(
+            llm=dict(
+                provider="groq", # or google, openai, anthropic, llama2, ...
+                config=dict(
+                    model=CONFIG["rxnorm_llm"],
+                    # temperature=0.5,
+                    # top_p=1,
+                    # stream=true,
+                ),
             ),
-        ),
-        embedder=dict(
-            provider="huggingface", # or openai, ollama, ...
-            config=dict(
-                model="BAAI/bge-small-en-v1.5",
-                #task_type="retrieval_document",
-                # title="Embeddings",
+            embedder=dict(
+                provider="huggingface", # or openai, ollama, ...
+                config=dict(
+                    model=CONFIG["rxnorm_embedder"],
+                    #task_type="retrieval_document",
+                    # title="Embeddings",
+                ),
             ),
-        ),
+        )
     )
-)
-#pip install sentence-transformers
 
 
+@_lazy
+def get_rxnorm_lookup():
+    from rxnorm_lookup import RxNormLookup
+    csv_path = CONFIG["rxnorm_csv"]
+    return RxNormLookup.from_csv(csv_path) if os.path.exists(csv_path) else None
+
 
-@tool('DuckDuckGoSearch')
-def search_tool(search_query: str):
-    """Search the web for information on a given topic"""
-    return DuckDuckGoSearchRun().run(search_query)
+@_lazy
+def get_rxnorm_lookup_tool():
+    from crewai_tools import tool
+    from deadlines import run_tool
+    from instrumentation import tool_span
+    from rxnorm_lookup import format_matches
+
+    # Exact/near-exact drug names and RXCUIs resolve from an in-memory index; only misses
+    # pay for a query embedding and vector search through the RxNorm search tool.
+    def lookup_drug(search_query):
+        with tool_span("RxNorm_lookup_tool", search_query) as span:
+            lookup = get_rxnorm_lookup()
+            matches = lookup.lookup(search_query) if lookup is not None else []
+            span["hit"] = bool(matches)
+            if matches:
+                return format_matches(matches)
+        with tool_span("RxNorm_tool", search_query):
+            return get_rxnorm_tool().run(search_query=search_query)
+
+    @tool('RxNorm Lookup')
+    def RxNorm_lookup_tool(search_query: str):
+        """Look up a drug in the RxNorm database by RXCUI or drug name, falling back to semantic search"""
+        return run_tool("RxNorm Lookup", lookup_drug, search_query)
+    return RxNorm_lookup_tool
+
+
+@_lazy
+def get_web_search():
+    # One search client for all agents. Repeated and concurrent identical queries are served
+    # from a TTL cache (optionally persisted to ER_SEARCH_CACHE); tests can swap in a
+    # web_search.LocalCorpusBackend through `get_web_search().backend`.
+    from web_search import CachedSearch, DuckDuckGoBackend
+    return CachedSearch(DuckDuckGoBackend(), disk_path=CONFIG["search_cache"])
+
+
+@_lazy
+def get_search_tool():
+    from crewai_tools import tool
+    from deadlines import run_tool
+    from instrumentation import tool_span
+
+    def search(search_query):
+        with tool_span("search_tool", search_query):
+            return get_web_search().run(search_query)
+
+    # Tool calls count against the running task's budget and are cut off when it runs out.
+    @tool('DuckDuckGoSearch')
+    def search_tool(search_query: str):
+        """Search the web for information on a given topic"""
+        return run_tool("DuckDuckGoSearch", search, search_query)
+    return search_tool
+
+
+TOOLS = dict(
+    search_tool = get_search_tool,
+    RxNorm_tool = get_rxnorm_tool,
+    RxNorm_lookup_tool = get_rxnorm_lookup_tool,
+)
 
 
 #*-----------------Agents-----------------*#
 
-triage_nurse = Agent(
+triage_nurse_template = AgentTemplate(
     role = "Triage Nurse",
     goal = """
         Conduct a thorough and rapid assessment of incoming patients using the KTAS
@@ -76,14 +259,13 @@ triage_nurse = Agent(
         reputation for remaining calm under pressure and have trained numerous junior 
         nurses in effective triage techniques.
     """,
-    tools = [search_tool],
-    llm=llm,
+    tools = ["search_tool"],
     max_iter = 5,
     allow_delegation = False, # controls whether the agent is allowed to delegate tasks to other agents. 'True' is also favorable 
     verbose = True,
 )
 
-emergency_physician = Agent(
+emergency_physician_template = AgentTemplate(
     role = "Emergency Physician",
     goal = """
         Provide rapid, accurate diagnoses and develop comprehensive treatment plans 
@@ -99,14 +281,13 @@ emergency_physician = Agent(
         trust of your patients. You are known for your calm demeanor in high-stress 
         situations and your commitment to evidence-based medicine.
     """,
-    tools = [search_tool],
-    llm=llm,
+    tools = ["search_tool"],
     max_iter = 5,
     allow_delegation = False, # controls whether the agent is allowed to delegate tasks to other agents. 'True' is also favorable 
     verbose = True,
 )
 
-pharmacist = Agent(
+pharmacist_template = AgentTemplate(
     role = "Emergency Room Pharmacist",
     goal = """
         Ensure safe and effective medication use in the emergency room by leveraging 
@@ -124,14 +305,13 @@ pharmacist = Agent(
         situations and are known for your ability to provide rapid, accurate 
         pharmacological consultations in high-pressure environments.
     """,
-    tools = [search_tool, RxNorm_tool],
-    llm=llm,
+    tools = ["search_tool", "RxNorm_lookup_tool"],
     max_iter = 5,
     allow_delegation = False, # controls whether the agent is allowed to delegate tasks to other agents. 'True' is also favorable 
     verbose = True,
 )
 
-er_doctor_in_charge = Agent(
+er_doctor_in_charge_template = AgentTemplate(
     role = "Emergency Room Doctor in Charge",
     goal = """
         Oversee and coordinate all aspects of patient care in the emergency department. 
@@ -148,8 +328,7 @@ er_doctor_in_charge = Agent(
         respected for your decisive leadership in critical situations and your 
         commitment to mentoring junior staff.
     """,
-    tools = [RxNorm_tool, search_tool],
-    llm=llm,
+    tools = ["RxNorm_lookup_tool", "search_tool"],
     max_iter = 5,
     allow_delegation = False, # controls whether the agent is allowed to delegate tasks to other agents. 'True' is also favorable 
     verbose = True,
@@ -158,7 +337,7 @@ er_doctor_in_charge = Agent(
 
 #*-----------------Tasks-----------------*#
 
-medical_diagnosis = Task(
+medical_diagnosis_template = TaskTemplate(
     description = """
         Based on the triage report and any additional examinations, provide a comprehensive 
         diagnosis and treatment plan for the patient with these symptoms:
@@ -178,7 +357,9 @@ medical_diagnosis = Task(
 
         Use the search tool to find the latest evidence-based guidelines or unusual clinical presentations if necessary.
     """,
-    agent = emergency_physician,
+    agent = "emergency_physician",
+    time_budget = 90,
+    max_tool_calls = 3,
     expected_output = """
         Provide a comprehensive medical report including:
         1. Primary working diagnosis with supporting evidence
@@ -231,7 +412,7 @@ medical_diagnosis = Task(
     """,
 )
 
-medication_review = Task(
+medication_review_template = TaskTemplate(
     description = """
         Conduct a comprehensive review of the prescribed medications for the patient with these symptoms:
         
@@ -239,9 +420,12 @@ medication_review = Task(
         {input}
         </symptoms>
 
-        Consider their medical history, current condition, and the emergency physician's treatment plan. 
+        Consider their medical history and current condition. Your review runs alongside the emergency 
+        physician's diagnosis, so review the medications documented for the patient (current and home 
+        medications, and any already given) and the drugs their presenting condition is likely to need; 
+        the ER Doctor in Charge checks the physician's treatment plan against your report.
         Your review should include:
-        1. A thorough analysis of each prescribed medication using the RxNorm tool
+        1. A thorough analysis of each of the patient's medications using the RxNorm tool
         2. Potential drug interactions, including severity and clinical significance
         3. Dose appropriateness considering the patient's condition, age, weight, and renal/hepatic function
         4. Any contraindications based on the patient's medical history or current condition
@@ -255,10 +439,12 @@ medication_review = Task(
         Use the search tool to find the latest pharmacological guidelines or information on rare 
         drug effects if necessary.
     """,
-    agent = pharmacist,
+    agent = "pharmacist",
+    time_budget = 90,
+    max_tool_calls = 4,
     expected_output = """
         Provide a detailed medication safety report including:
-        1. List of prescribed medications with a comprehensive analysis of each
+        1. List of the patient's medications with a comprehensive analysis of each
         2. Identified drug interactions, contraindications, or concerns
         3. Dose appropriateness evaluations and any recommended adjustments
         4. Specific administration instructions and precautions
@@ -301,7 +487,7 @@ medication_review = Task(
     """,
 )
 
-triage_assessment = Task(
+triage_assessment_template = TaskTemplate(
     description = """
         Conduct a comprehensive triage assessment of the patient presenting with these symptoms:
 
@@ -349,7 +535,9 @@ triage_assessment = Task(
 
         Use the search tool to find any additional information about unusual symptoms or conditions if necessary.
     """,
-    agent = triage_nurse,
+    agent = "triage_nurse",
+    time_budget = 45, # triage has a hard SLA
+    max_tool_calls = 2,
     expected_output = """
         Provide a comprehensive triage report including:
         1. KTAS level assigned (1-5) with detailed justification based on the KTAS criteria
@@ -380,12 +568,12 @@ triage_assessment = Task(
         Additional Information: [Any relevant data from search tool, if used]
     """,
     context = [
-    medical_diagnosis,
-    medication_review,
+    "medical_diagnosis",
+    "medication_review",
     ],
 )
 
-er_management_decision = Task(
+er_management_decision_template = TaskTemplate(
     description = """
         As the Emergency Room Doctor in Charge, review all the information provided by the triage nurse, 
         emergency physician, and pharmacist for the patient with these symptoms:
@@ -399,7 +587,8 @@ er_management_decision = Task(
         process should include:
         1. A thorough review of the KTAS classification and its implications for immediate care
         2. Evaluation of the diagnosis, differential diagnoses, and proposed treatment plan
-        3. Consideration of the medication safety report and any pharmacological concerns
+        3. Consideration of the medication safety report and any pharmacological concerns, including 
+           interactions between the physician's proposed medications and the patient's current ones
         4. Assessment of the need for immediate interventions, further diagnostic tests, or specialist consultations
         5. Determination of the most appropriate next steps for patient care (e.g., continued ER management, 
            admission to a specific unit, transfer to a specialized facility, or safe discharge with follow-up)
@@ -409,7 +598,9 @@ er_management_decision = Task(
         Use the RxNorm tool to double-check any medication decisions. Use the search tool to find relevant 
         clinical guidelines or hospital protocols if necessary for decision-making.
     """,
-    agent = er_doctor_in_charge,
+    agent = "er_doctor_in_charge",
+    time_budget = 90,
+    max_tool_calls = 3,
     expected_output = """
         Provide a comprehensive management decision including:
         1. Restatement of the KTAS classification with your assessment of its accuracy
@@ -461,39 +652,496 @@ er_management_decision = Task(
         [List any guidelines or protocols referenced, if search tool was used]
     """,
     context = [
-        triage_assessment,
-        medical_diagnosis,
-        medication_review,
+        "triage_assessment",
+        "medical_diagnosis",
+        "medication_review",
     ],
     output_file = "er_management_decision.md",
 )
 
 
 
+#*-----------------Registry-----------------*#
+
+AGENT_TEMPLATES = dict(
+    triage_nurse = triage_nurse_template,
+    emergency_physician = emergency_physician_template,
+    pharmacist = pharmacist_template,
+    er_doctor_in_charge = er_doctor_in_charge_template,
+)
+
+# Every task is listed after the tasks in its context.
+TASK_TEMPLATES = dict(
+    medical_diagnosis = medical_diagnosis_template,
+    medication_review = medication_review_template,
+    triage_assessment = triage_assessment_template,
+    er_management_decision = er_management_decision_template,
+)
+
+
+def build_agents(llms=None):
+    """
+    New Agent objects for every template, sharing the process-wide tools. Agents use
+    the shared LLM unless `llms` maps their name to another model.
+    """
+    from instrumentation import record_agent_step
+
+    llms = llms or {}
+    return {
+        name: template.build(
+            llms.get(name) or get_llm(),
+            [TOOLS[tool]() for tool in template.tools],
+            step_callback=record_agent_step,
+        )
+        for name, template in AGENT_TEMPLATES.items()
+    }
+
+
+def build_tasks(agents, output_dir=None):
+    """
+    New Task objects for every template, wired to `agents` (as returned by
+    build_agents). Task output files are only written when `output_dir` is given.
+    """
+    tasks = {}
+    for name, template in TASK_TEMPLATES.items():
+        output_file = None
+        if output_dir and template.output_file:
+            output_file = os.path.join(output_dir, template.output_file)
+        tasks[name] = template.build(
+            agents[template.agent],
+            [tasks[upstream] for upstream in template.context],
+            output_file,
+        )
+    return tasks
+
+
+@_lazy
+def get_agents():
+    return build_agents()
+
+
+@_lazy
+def get_tasks():
+    return build_tasks(get_agents())
+
+
+def warm_up():
+    """Build the shared LLM clients, RxNorm indexes and tools now instead of on first use."""
+    get_llm()
+    get_small_llm()
+    get_rxnorm_index()
+    get_rxnorm_lookup()
+    for get_tool in TOOLS.values():
+        get_tool()
+
+
+
 #*-----------------Crew-----------------*#
 
-class EmergencyRoomQA:
-    def __init__(self):
-        self.crew = Crew(
-            tasks=[
-                medical_diagnosis,
-                medication_review,
-                triage_assessment,
-                er_management_decision
-            ],
-            agents=[
-                emergency_physician,
-                pharmacist,
-                triage_nurse,
-                er_doctor_in_charge
-            ],
-            verbose=2,
+class CrewInstance:
+    """
+    One request's agents and tasks, freshly built from the shared templates. Only the
+    LLM clients, embedder, RxNorm indexes and tools are shared with other instances.
+
+    With a model_routing.ModelRouter, tasks routed to the small tier run on a second
+    copy of their agent using the small model and are redone on the regular agent when
+    the router escalates. `provisional` is the pre-triage result the router may use, and
+    `wrap_llm(agent_name, llm)` can adapt every model an agent gets (e.g. for streaming).
+
+    `deadline` (seconds) bounds the whole run and each task's time_budget/max_tool_calls
+    bounds that task (deadlines.py); a task that runs out returns a best-effort answer.
+    A sequential run with a deadline goes through the scheduler with one worker rather
+    than crew.kickoff, which has no per-task hook to degrade at.
+
+    Tasks named in `reuse` return that output without running; with a task_memo.TaskMemo
+    the others are looked up by template, rendered inputs and upstream context first.
+    """
+
+    def __init__(self, request_id=None, parallel=True, max_workers=None, output_dir=None, llms=None,
+                 compact_context=True, router=None, provisional=None, wrap_llm=None, deadline=None,
+                 task_budgets=True, memo=None, reuse=None):
+        from instrumentation import RequestTrace
+
+        self.request_id = request_id or uuid.uuid4().hex
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self.compact_context = compact_context
+        self.router = router
+        self.provisional = provisional
+        self.wrap_llm = wrap_llm
+        self.deadline = deadline
+        self.task_budgets = task_budgets
+        self.memo = memo
+        self.reuse = dict(reuse or {})
+        llms = dict(llms or {})
+        if wrap_llm is not None:
+            llms = {name: wrap_llm(name, llms.get(name) or get_llm()) for name in AGENT_TEMPLATES}
+        self.agents = build_agents(llms)
+        self._tier_agents = {}
+        self._tier_lock = threading.Lock()
+        self.tasks = build_tasks(
+            self.agents,
+            output_dir=os.path.join(output_dir, self.request_id) if output_dir else None,
+        )
+        self.outputs = {}
+        self.token_report = []
+        self.trace = RequestTrace(self.request_id)
+
+    def _build_context(self, names):
+        from context_compaction import compact_context, count_tokens
+
+        lock = threading.Lock()
+
+        def build(task, upstream):
+            name = names[id(task)]
+            raw = join_context(task, upstream)
+            if self.compact_context:
+                context = compact_context(name, [(names[id(t)], output) for t, output in upstream])
+            else:
+                context = raw
+            context_tokens = count_tokens(context)
+            row = dict(
+                task = name,
+                raw_context_tokens = count_tokens(raw) if self.compact_context else context_tokens,
+                context_tokens = context_tokens,
+                prompt_tokens = count_tokens(task.description) + count_tokens(task.expected_output) + context_tokens,
+            )
+            with lock:
+                self.token_report.append(row)
+            return context
+        return build
+
+    def _tier_agent(self, agent_name, tier):
+        """This request's copy of `agent_name` running on the `tier` model, built on first use."""
+        from instrumentation import record_agent_step
+
+        with self._tier_lock:
+            agent = self._tier_agents.get((agent_name, tier))
+            if agent is None:
+                template = AGENT_TEMPLATES[agent_name]
+                llm = get_tier_llm(tier)
+                if self.wrap_llm is not None:
+                    llm = self.wrap_llm(agent_name, llm)
+                agent = template.build(llm, [TOOLS[tool]() for tool in template.tools], step_callback=record_agent_step)
+                self._tier_agents[agent_name, tier] = agent
+            return agent
+
+    def _execute_budgeted(self, task, context, span, budget, agent=None):
+        from deadlines import COMPLETE_REPORT, BudgetExceeded, run_within_budget
+
+        try:
+            return run_within_budget(budget, execute_task, task, context, agent=agent)
+        except BudgetExceeded:
+            if budget.stop_reason != COMPLETE_REPORT:
+                raise
+            # the agent wrote its full report and went on using tools: that report is the answer
+            span["stopped"] = COMPLETE_REPORT
+            output = budget.complete_output
+            budget.stop_reason = budget.complete_output = None
+            return output
+
+    def _run_routed(self, name, task, context, span, budget):
+        from instrumentation import ESCALATIONS
+        from model_routing import LARGE
+
+        tier = self.router.initial_tier(name, self.provisional) if self.router else LARGE
+        span["model_tier"] = tier
+        if tier == LARGE:
+            return self._execute_budgeted(task, context, span, budget)
+        agent = self._tier_agent(TASK_TEMPLATES[name].agent, tier)
+        output = self._execute_budgeted(task, context, span, budget, agent=agent)
+        reason = self.router.escalation_reason(name, output, span["iterations"] >= task.agent.max_iter)
+        if reason is None or budget.expired():
+            return output
+        span["escalated"] = reason
+        ESCALATIONS.inc(task=name, reason=reason.split(":")[0])
+        logger.info("%s: escalating to the large model (%s)", name, reason)
+        return self._execute_budgeted(task, context, span, budget)
+
+    def _execute_task(self, names):
+        from deadlines import BudgetExceeded, best_effort, task_budget
+        from instrumentation import DEGRADED, task_span
+
+        def execute(task, context):
+            name = names[id(task)]
+            template = TASK_TEMPLATES[name]
+            seconds, max_tool_calls = (template.time_budget, template.max_tool_calls) if self.task_budgets else (None, None)
+            with task_span(name, max_iter=task.agent.max_iter) as span:
+                if name in self.reuse:
+                    span["reused"] = "last run"
+                    return self.reuse[name]
+                key = self._memo_key(name, task, context) if self.memo is not None else None
+                output = self.memo.get(key) if key else None
+                if output is not None:
+                    span["reused"] = "memo"
+                    return output
+                with task_budget(name, seconds, max_tool_calls) as budget:
+                    try:
+                        output = self._run_routed(name, task, context, span, budget)
+                    except BudgetExceeded as e:
+                        # bounded latency over polish: answer with what the agent has so far
+                        span["degraded"] = str(e)
+                        DEGRADED.inc(task=name, reason=str(e))
+                        logger.warning("%s: %s, using the best answer so far", name, e)
+                        return best_effort(name, budget, self.provisional)
+                if key:
+                    self.memo.put(key, output)
+                return output
+        return execute
+
+    def _memo_key(self, name, task, context):
+        from task_memo import task_key
+
+        salt = [CONFIG["model_name"], CONFIG["small_model_name"], CONFIG["temperature"]]
+        if self.router is not None:
+            salt.append(self.router.initial_tier(name, self.provisional))
+        return task_key(TASK_TEMPLATES[name], task.description, task.expected_output, context, repr(salt))
+
+    def run(self, inputs, on_task_complete=None):
+        """
+        Run every task and return the final (er_management_decision) output.
+        `on_task_complete(task_name, output)` is called as each task finishes.
+        Timings, iterations, LLM and tool calls are recorded in self.trace.
+        """
+        from deadlines import request_deadline
+
+        with self.trace.activate(), request_deadline(self.deadline):
+            return self._run(inputs, on_task_complete)
+
+    def _run(self, inputs, on_task_complete):
+        tasks = list(self.tasks.values())
+        if (not self.parallel and on_task_complete is None and self.memo is None and not self.reuse
+                and self.deadline is None):
+            from crewai import Crew
+
+            crew = Crew(tasks=tasks, agents=list(self.agents.values()), verbose=2)
+            result = crew.kickoff(inputs=inputs)
+            for name, task in self.tasks.items():
+                output = getattr(task, "output", None)
+                if output is not None:
+                    self.outputs[name] = getattr(output, "raw", None) or getattr(output, "raw_output", None) or str(output)
+            return result
+
+        names = {id(task): name for name, task in self.tasks.items()}
+
+        def task_complete(task, output):
+            self.outputs[names[id(task)]] = output
+            if on_task_complete is not None:
+                on_task_complete(names[id(task)], output)
+
+        # medical_diagnosis and medication_review have no context dependencies, so the
+        # scheduler runs them concurrently; triage_assessment and er_management_decision
+        # start as soon as their upstream outputs are ready. Unlike the sequential crew,
+        # medication_review does not see the physician's plan here: the pharmacist reviews
+        # the patient's own medications and er_management_decision reconciles the two.
+        # Add "medical_diagnosis" to its template context to trade that for latency.
+        max_workers = self.max_workers if self.parallel else 1
+        # Downstream tasks receive only the fields they need from upstream reports (see
+        # context_compaction.py); self.token_report records the prompt tokens saved.
+        scheduler = TaskScheduler(
+            tasks,
+            max_workers=max_workers,
+            context_builder=self._build_context(names),
+            executor=self._execute_task(names),
         )
+        outputs = scheduler.run(inputs, task_complete)
+        return outputs[-1]
+
+
+class EmergencyRoomQA:
+    """
+    Every get_result call runs on its own CrewInstance, so a single EmergencyRoomQA can
+    serve many patients concurrently. Pass `output_dir` to keep each request's
+    er_management_decision.md under `<output_dir>/<request_id>/`.
+
+    Before the crew starts, a rule-based pre-triage (pre_triage.py) derives a
+    provisional KTAS level from the symptoms text in milliseconds, so KTAS 1-2 cases
+    are flagged (a logged warning, and `on_pre_triage`) while the agents are still working.
+    Escalations and degraded tasks are logged too and recorded in the request trace.
+
+    get_result returns the final report text, as it always has; get_er_result returns
+    an er_result.ERResult with that report plus the KTAS level, diagnosis, medications,
+    disposition and per-task timings.
+
+    With `trace_path`, every request's trace (per task, LLM call and tool call) is
+    appended there as one JSON line; aggregate histograms are always collected in
+    instrumentation.METRICS.
+
+    With `routing` (the default), medication_review and triage_assessment of patients
+    pre-triaged as KTAS 4-5 start on the small model (CONFIG["small_model_name"]) and are
+    escalated to the large one as model_routing.ModelRouter decides; without pre_triage
+    every task runs on the large model. Pass a ModelRouter to change the routes, or
+    False to run everything on the large model. Routing needs `parallel` or a
+    streaming run, since the sequential crew.kickoff path has no per-task hook.
+
+    `deadline` is the default wall-clock limit in seconds for one request (get_result
+    takes its own); with `task_budgets` every task is also held to its template's
+    time_budget and max_tool_calls. Tasks that run out degrade to a best-effort answer
+    (listed in ERResult.degraded); a late triage falls back to the pre-triage KTAS level
+    when a pre-triage rule matched. Batch callers that wait on a rate limiter inside LLM
+    calls should pass task_budgets=False, since the wait counts against the budget.
+
+    Pass `memo=True` (or a TaskMemo, with a path to persist it) to memoize task outputs
+    (task_memo.py). reevaluate() re-runs a patient after their symptoms text changed and
+    reuses every task of their last run that the change cannot affect. Every task renders
+    the whole symptoms text, so that is only a re-submission differing in whitespace.
+    """
+
+    MAX_PATIENTS = 1024  # last runs kept for reevaluate()
 
-    def get_result(self, symptoms):
-        result = self.crew.kickoff(
-            inputs={
-                "input": symptoms
-            }
+    def __init__(self, parallel=True, max_workers=None, output_dir=None, pre_triage=True,
+                 compact_context=True, trace_path=None, routing=True, deadline=None, task_budgets=True,
+                 memo=None):
+        from model_routing import ModelRouter
+        from task_memo import TaskMemo
+
+        self.parallel = parallel
+        self.memo = TaskMemo() if memo is True else (memo or None)
+        self._patients = OrderedDict()  # patient_id -> {"inputs": ..., "outputs": ...} of the last run
+        self._patients_lock = threading.Lock()
+        self.deadline = deadline
+        self.task_budgets = task_budgets
+        self.trace_path = trace_path
+        self.router = routing if isinstance(routing, ModelRouter) else (ModelRouter() if routing else None)
+        self.compact_context = compact_context
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        self.pre_triage = pre_triage
+        self.llm = get_llm()
+
+    def new_crew(self, request_id=None, llms=None, provisional=None, wrap_llm=None, deadline=None, reuse=None):
+        return CrewInstance(
+            request_id=request_id,
+            parallel=self.parallel,
+            max_workers=self.max_workers,
+            output_dir=self.output_dir,
+            llms=llms,
+            compact_context=self.compact_context,
+            router=self.router,
+            provisional=provisional,
+            wrap_llm=wrap_llm,
+            deadline=deadline if deadline is not None else self.deadline,
+            task_budgets=self.task_budgets,
+            memo=self.memo,
+            reuse=reuse,
         )
+
+    def run_pre_triage(self, symptoms):
+        """Provisional KTAS level for `symptoms`, or None when pre-triage is disabled."""
+        if not self.pre_triage:
+            return None
+        from pre_triage import pre_triage
+
+        result = pre_triage(symptoms)
+        if result.urgent:
+            logger.warning("pre-triage: %s", result.summary())
+        return result
+
+    def get_result(self, symptoms, request_id=None, on_pre_triage=None, deadline=None):
+        """The final (er_management_decision) report for `symptoms`, as a string."""
+        return self.get_er_result(symptoms, request_id, on_pre_triage, deadline).output
+
+    def get_er_result(self, symptoms, request_id=None, on_pre_triage=None, deadline=None):
+        """The final report plus the fields parsed from every stage, as an er_result.ERResult."""
+        inputs = {
+            "input": symptoms
+        }
+        return self._run(symptoms, inputs, request_id, on_pre_triage, deadline)[1]
+
+    def _run(self, symptoms, inputs, request_id, on_pre_triage, deadline, reuse=None):
+        from er_result import ERResult
+
+        provisional = self.run_pre_triage(symptoms)
+        if provisional is not None and on_pre_triage is not None:
+            on_pre_triage(provisional)
+        crew = self.new_crew(request_id, provisional=provisional, deadline=deadline, reuse=reuse)
+        try:
+            output = crew.run(inputs)
+        finally:
+            self._export_trace(crew)
+        return crew, ERResult.from_crew(crew, symptoms, output, provisional)
+
+    def reevaluate(self, patient_id, symptoms, request_id=None, on_pre_triage=None, deadline=None):
+        """
+        Run `patient_id` with their updated symptoms text. Compared with their last run,
+        only tasks rendering a changed input and the tasks downstream of them execute
+        again; the rest return their previous outputs (see ERResult.reused). The first
+        call for a patient is a full run.
+        """
+        from task_memo import affected_tasks, normalize_input
+
+        inputs = {"input": normalize_input(symptoms)}
+        with self._patients_lock:
+            last = self._patients.get(patient_id)
+        reuse = {}
+        if last is not None:
+            affected = affected_tasks(TASK_TEMPLATES, last["inputs"], inputs)
+            reuse = {name: output for name, output in last["outputs"].items() if name not in affected}
+        crew, result = self._run(symptoms, inputs, request_id, on_pre_triage, deadline, reuse)
+        with self._patients_lock:
+            self._patients[patient_id] = dict(inputs=inputs, outputs=dict(crew.outputs))
+            self._patients.move_to_end(patient_id)
+            while len(self._patients) > self.MAX_PATIENTS:
+                self._patients.popitem(last=False)
         return result
+
+    def _export_trace(self, crew):
+        if self.trace_path:
+            crew.trace.write_jsonl(self.trace_path)
+
+    def _streaming_run(self, symptoms, request_id, tokens):
+        from streaming import StreamEvent, streaming_llm
+
+        def run(emit):
+            provisional = self.run_pre_triage(symptoms)
+            if provisional is not None:
+                emit(StreamEvent("pre_triage", "pre_triage", provisional))
+            wrap_llm = None
+            if tokens:
+                task_of = {template.agent: name for name, template in TASK_TEMPLATES.items()}
+                wrap_llm = lambda agent, llm: streaming_llm(llm, task_of[agent], emit)
+            crew = self.new_crew(request_id, provisional=provisional, wrap_llm=wrap_llm)
+            try:
+                crew.run(
+                    {"input": symptoms},
+                    on_task_complete=lambda name, output: emit(StreamEvent("task", name, output)),
+                )
+            finally:
+                self._export_trace(crew)
+        return run
+
+    def stream(self, symptoms, request_id=None, tokens=False):
+        """
+        Yield StreamEvent("pre_triage", ...) with the provisional KTAS level first, then
+        StreamEvent("task", name, output) as soon as each task finishes, so the
+        triage_assessment report (and its KTAS level, see streaming.ktas_level) arrives
+        before er_management_decision. With `tokens=True` the LLM tokens of every task
+        are streamed as StreamEvent("token", name, text) as well.
+        """
+        from streaming import stream_events
+        return stream_events(self._streaming_run(symptoms, request_id, tokens))
+
+    def astream(self, symptoms, request_id=None, tokens=False):
+        """Async-generator version of stream()."""
+        from streaming import astream_events
+        return astream_events(self._streaming_run(symptoms, request_id, tokens))
+
+
+#*-----------------Lazy module attributes-----------------*#
+
+_LAZY_GLOBALS = dict(
+    GROQ_API_KEY = lambda: os.environ['GROQ_API_KEY'],
+    llm = get_llm,
+    RxNorm_index = get_rxnorm_index,
+    RxNorm_lookup = get_rxnorm_lookup,
+    web_search = get_web_search,
+    **TOOLS,
+    **{name: (lambda name=name: get_agents()[name]) for name in AGENT_TEMPLATES},
+    **{name: (lambda name=name: get_tasks()[name]) for name in TASK_TEMPLATES},
+)
+
+
+def __getattr__(name):
+    if name in _LAZY_GLOBALS:
+        return _LAZY_GLOBALS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,224 @@
+import contextlib
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from context_compaction import missing_fields, report_body
+
+# Wall-clock limits for a request and for each of its tasks. The request deadline and the
+# running task's budget live in context variables, so the LLM callback and the tools see
+# them in TaskScheduler's worker threads. An exhausted budget stops the agent at its next
+# LLM call (BudgetExceeded), tools stop calling out, and CrewInstance returns the best
+# answer it has instead of an error. A task also runs under a future bounded by its budget
+# (run_within_budget), so an LLM call still waiting on the client timeout does not hold
+# the request past its deadline. An agent that already wrote a complete report but wants
+# to keep using tools is stopped the same way (COMPLETE_REPORT); CrewInstance takes that
+# report as a regular answer, so it still goes through model routing.
+
+MAX_TOOL_WORKERS = 16
+MAX_TASK_WORKERS = 32
+
+COMPLETE_REPORT = "complete report written"
+
+_request_deadline = contextvars.ContextVar("er_request_deadline", default=None)
+_current_budget = contextvars.ContextVar("er_task_budget", default=None)
+
+
+class BudgetExceeded(Exception):
+    """Raised at an LLM call once the running task has to stop."""
+
+
+@contextlib.contextmanager
+def request_deadline(seconds):
+    """Deadline for everything run inside, `seconds` from now; None means no limit."""
+    if seconds is None:
+        yield None
+        return
+    deadline = time.monotonic() + seconds
+    token = _request_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _request_deadline.reset(token)
+
+
+class TaskBudget:
+    def __init__(self, task, deadline=None, max_tool_calls=None):
+        self.task = task
+        self.deadline = deadline  # time.monotonic() value, or None
+        self.max_tool_calls = max_tool_calls
+        self.tool_calls = 0
+        self.last_output = None  # text of the agent's latest LLM call
+        self.complete_output = None  # a complete report the agent wrote before its final answer
+        self.stop_reason = None
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def take_tool_call(self):
+        """Count a tool call; None if allowed, else why not."""
+        with self._lock:
+            if self.stop_reason is not None:
+                return self.stop_reason
+            if self.expired():
+                return "time budget exhausted"
+            if self.max_tool_calls is not None and self.tool_calls >= self.max_tool_calls:
+                return "tool call budget exhausted"
+            self.tool_calls += 1
+            return None
+
+
+@contextlib.contextmanager
+def task_budget(task, seconds=None, max_tool_calls=None):
+    """Budget for one task: `seconds` from now, capped by the request deadline."""
+    deadlines = [d for d in (_request_deadline.get(), seconds and time.monotonic() + seconds) if d]
+    budget = TaskBudget(task, min(deadlines) if deadlines else None, max_tool_calls)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+#*-----------------Tools-----------------*#
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(name="tool", max_workers=MAX_TOOL_WORKERS):
+    # tasks and tools get separate pools: a task waiting on its tool calls never starves them
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"er-{name}")
+        return _pools[name]
+
+
+def run_tool(name, fn, *args):
+    """
+    Call a tool within the running task's budget. Returns an observation telling the
+    agent to answer with what it has when the budget does not allow the call, or when
+    the call does not finish in the remaining time (it keeps running in the background).
+    """
+    budget = current_budget()
+    if budget is None:
+        return fn(*args)
+    refused = budget.take_tool_call()
+    if refused is not None:
+        return f"{name} not called: {refused}. Give your final answer now with the information you have."
+    timeout = budget.remaining()
+    if timeout is None:
+        return fn(*args)
+    future = _pool().submit(contextvars.copy_context().run, fn, *args)
+    try:
+        return future.result(timeout=max(0.0, timeout))
+    except TimeoutError:
+        return f"{name} timed out. Give your final answer now with the information you have."
+
+
+#*-----------------Tasks-----------------*#
+
+def run_within_budget(budget, fn, *args, **kwargs):
+    """
+    Call `fn` (an agent working on its task) until it returns or `budget` runs out, then
+    raise BudgetExceeded. The abandoned call keeps running in the background until its
+    current LLM call returns, and is stopped by DeadlineCallback at the next one.
+    """
+    timeout = budget.remaining() if budget is not None else None
+    if timeout is None:
+        return fn(*args, **kwargs)
+    future = _pool("task", MAX_TASK_WORKERS).submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=max(0.0, timeout))
+    except TimeoutError:
+        with budget._lock:
+            if budget.stop_reason is None:
+                budget.stop_reason = "time budget exhausted"
+        raise BudgetExceeded(budget.stop_reason)
+
+
+#*-----------------LLM callback-----------------*#
+
+class DeadlineCallback(BaseCallbackHandler):
+    """Stops the agent at its next LLM call once its task budget or the request deadline is spent."""
+
+    raise_error = True
+
+    def _check(self):
+        budget = current_budget()
+        if budget is not None:
+            if budget.stop_reason is None and budget.expired():
+                budget.stop_reason = "time budget exhausted"
+            if budget.stop_reason is not None:
+                raise BudgetExceeded(budget.stop_reason)
+        else:
+            deadline = _request_deadline.get()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise BudgetExceeded("request deadline passed")
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._check()
+
+    def on_llm_end(self, response, **kwargs):
+        budget = current_budget()
+        if budget is None or not response.generations or not response.generations[0]:
+            return
+        text = response.generations[0][0].text
+        budget.last_output = text
+        # a full report followed by more tool use: keep the report and stop the agent there
+        if "final answer" not in text.lower() and not missing_fields(budget.task, text):
+            budget.complete_output = report_body(budget.task, text)
+            budget.stop_reason = COMPLETE_REPORT
+
+
+DEADLINE_CALLBACK = DeadlineCallback()
+
+
+def attach_deadlines(llm):
+    """Add DEADLINE_CALLBACK to a LangChain model's callbacks (once) and return it."""
+    callbacks = llm.callbacks if isinstance(llm.callbacks, list) else []
+    if DEADLINE_CALLBACK not in callbacks:
+        callbacks.append(DEADLINE_CALLBACK)
+    llm.callbacks = callbacks
+    return llm
+
+
+#*-----------------Best effort-----------------*#
+
+def best_effort(task, budget, provisional=None):
+    """The answer for a task stopped by its budget: its complete report if it wrote one, else what there is."""
+    if budget.complete_output:
+        return budget.complete_output
+    partial = report_body(task, budget.last_output) if budget.last_output else ""
+    if partial and not missing_fields(task, partial):
+        return partial
+    if task == "triage_assessment":
+        # the pre-triage level only counts as evidence when one of its rules matched
+        if provisional is not None and provisional.criteria:
+            return (
+                f"KTAS CLASSIFICATION: {provisional.level}\n\n"
+                f"Detailed Justification: Provisional rule-based level; the triage assessment did not finish "
+                f"within its time budget ({budget.stop_reason}). {provisional.summary()}"
+            )
+        return (
+            f"KTAS CLASSIFICATION: Undetermined\n\n"
+            f"Detailed Justification: The triage assessment did not finish within its time budget "
+            f"({budget.stop_reason}) and no pre-triage rule matched; the KTAS level has to be assessed directly."
+            + (f"\n\nPartial output:\n{partial}" if partial else "")
+        )
+    note = f"[{task}] No complete report within the time budget ({budget.stop_reason})."
+    return f"{note}\n\nPartial output:\n{partial}" if partial else note
@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+# Query embeddings for concurrent requests. Single-text forward passes leave most of the
+# CPU idle, so texts arriving within a few milliseconds of each other are encoded as one
+# batch; drug names repeat a lot, so recent results are kept in an LRU.
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT = 0.003  # seconds a batch stays open for more texts
+DEFAULT_CACHE_SIZE = 4096
+
+
+class EmbeddingService:
+    """
+    Micro-batching front-end for `encode(list_of_texts) -> 2-D array`. embed() blocks the
+    caller until its vector is ready; a single daemon thread collects pending texts for up
+    to `max_wait` seconds or `max_batch` texts and runs them in one encode call.
+    Identical texts waiting at the same time share one slot in the batch.
+    """
+
+    def __init__(self, encode, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._queue = []  # texts waiting for a batch, in arrival order
+        self._inflight = {}  # text -> Future, until its vector is cached
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._worker = None
+        self.stats = dict(hits=0, misses=0, batches=0, encoded=0)
+
+    def _submit(self, text):
+        # caller holds the lock; returns the cached vector or a Future for it
+        vector = self._cache.get(text)
+        if vector is not None:
+            self._cache.move_to_end(text)
+            self.stats["hits"] += 1
+            return vector
+        self.stats["misses"] += 1
+        future = self._inflight.get(text)
+        if future is None:
+            future = self._inflight[text] = Future()
+            self._queue.append(text)
+            self._ready.notify()
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="er-embed", daemon=True)
+            self._worker.start()
+        return future
+
+    def embed(self, text):
+        """Vector for `text` (read-only, shared with other callers)."""
+        with self._lock:
+            result = self._submit(text)
+        return result.result() if isinstance(result, Future) else result
+
+    def embed_many(self, texts):
+        """Vectors for `texts`, all queued at once so they share batches."""
+        with self._lock:
+            results = [self._submit(text) for text in texts]
+        return [result.result() if isinstance(result, Future) else result for result in results]
+
+    def _take_batch(self):
+        with self._lock:
+            while not self._queue:
+                self._ready.wait()
+            # keep the batch open briefly so concurrent callers can join it
+            self._ready.wait_for(lambda: len(self._queue) >= self.max_batch, timeout=self.max_wait)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            texts = self._take_batch()
+            try:
+                vectors = np.asarray(self.encode(texts))
+            except BaseException as e:
+                with self._lock:
+                    futures = [self._inflight.pop(text) for text in texts]
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["encoded"] += len(texts)
+                futures = []
+                for text, vector in zip(texts, vectors):
+                    vector.flags.writeable = False
+                    self._cache[text] = vector
+                    futures.append(self._inflight.pop(text))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
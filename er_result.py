@@ -0,0 +1,293 @@
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+
+from context_compaction import REPORT_FIELDS, extract_fields
+
+# What EmergencyRoomQA.get_er_result returns: the final report plus the fields parsed out
+# of every stage's report, and buffered JSONL/Parquet writers for storing many of them.
+
+DISPOSITIONS = ("Continue ER care", "Admit", "Transfer", "Discharge")
+_DISPOSITION_RE = re.compile(r"\b(continue(?:d)? (?:er|ed|emergency room|emergency department) care|admi(?:t|ssion)|transfer|discharge)", re.I)
+_DISPOSITION_NEGATION_RE = re.compile(
+    r"\b(?:not|no|never|unsafe|unsuitable|rather than|instead of|avoid|defer(?:red)?)\b[^.;,:]{0,30}$", re.I
+)
+# negation after the disposition word, in the same clause: "discharge is not appropriate"
+_DISPOSITION_NEGATED_AFTER_RE = re.compile(
+    r"^[^.;,:]{0,30}?\b(?:(?:is|are|was|would be|will be|should be|seems|appears)\s+(?:not|no longer|never|unsafe|"
+    r"unsuitable|inappropriate|inadvisable|contraindicated)|isn't|not (?:appropriate|indicated|recommended|safe|advised|"
+    r"warranted|suitable|possible|feasible|an option)|ruled out)\b",
+    re.I,
+)
+_NUMBERED_ITEM_RE = re.compile(r"^\s*\d+\.\s*[*_]*\s*([A-Za-z][^:(\n*\[]*?)\s*(?:\(|:|\*|$)", re.M)
+_LETTERED_ITEM_RE = re.compile(r"^\s*[a-z]\.\s*[*_]*\s*([A-Za-z][^,:(\n*\[]*?)\s*(?:,|\(|:|-|\*|$)", re.M)
+
+
+def _first_line(text):
+    return text.strip().split("\n")[0].strip(" *_") if text else None
+
+
+def parse_disposition(text):
+    """
+    One of DISPOSITIONS for the first disposition the first line of `text` decides on
+    (skipping negated ones, as in "not suitable for discharge" or "discharge is not
+    appropriate"), else that line.
+    """
+    line = _first_line(text)
+    if not line:
+        return None
+    matches = list(_DISPOSITION_RE.finditer(line))
+    for i, match in enumerate(matches):
+        # a negation only reaches back to the previous disposition word and on to the next
+        before = line[matches[i - 1].end() if i else 0:match.start()]
+        after = line[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(line)]
+        if _DISPOSITION_NEGATION_RE.search(before) or _DISPOSITION_NEGATED_AFTER_RE.search(after):
+            continue
+        word = match.group(1).lower()
+        for disposition in DISPOSITIONS:
+            if word[:4] == disposition.lower()[:4]:
+                return disposition
+        return DISPOSITIONS[0]
+    return line
+
+
+def parse_medications(medication_review=None, medical_diagnosis=None):
+    """Drug names from the pharmacist's medication analysis, else from the physician's treatment plan."""
+    section = extract_fields("medication_review", medication_review).get("medications")
+    names = _NUMBERED_ITEM_RE.findall(section) if section else []
+    if not names:
+        plan = extract_fields("medical_diagnosis", medical_diagnosis).get("treatment_plan")
+        names = _LETTERED_ITEM_RE.findall(plan) if plan else []
+    seen = []
+    for name in names:
+        name = name.strip()
+        if name and name.lower() not in (n.lower() for n in seen):
+            seen.append(name)
+    return seen
+
+
+#*-----------------Result-----------------*#
+
+@dataclass
+class ERResult:
+    request_id: str
+    symptoms: str
+    output: str  # the er_management_decision report
+    reports: dict = field(default_factory=dict)  # task -> raw report
+    ktas_level: int = None
+    provisional_ktas: int = None  # rule-based pre-triage level, if it ran
+    primary_diagnosis: str = None
+    medications: list = field(default_factory=list)
+    disposition: str = None
+    timings: dict = field(default_factory=dict)  # task -> seconds
+    duration: float = None
+    reused: list = field(default_factory=list)  # tasks answered from the last run or the task memo
+    degraded: list = field(default_factory=list)  # "task: reason" of tasks that ran out of budget
+
+    def __str__(self):
+        return self.output
+
+    @classmethod
+    def from_crew(cls, crew, symptoms, output, provisional=None):
+        """Build from a finished CrewInstance, its final output and the pre-triage result."""
+        from streaming import ktas_level
+
+        reports = {name: str(text) for name, text in crew.outputs.items()}
+        output = str(getattr(output, "raw", output))
+        reports.setdefault("er_management_decision", output)
+        diagnosis = extract_fields("medical_diagnosis", reports.get("medical_diagnosis"))
+        decision = extract_fields("er_management_decision", reports.get("er_management_decision"))
+        summary = crew.trace.summary()
+        return cls(
+            request_id = crew.request_id,
+            symptoms = symptoms,
+            output = output,
+            reports = reports,
+            ktas_level = ktas_level(reports.get("triage_assessment")),
+            provisional_ktas = provisional.level if provisional is not None else None,
+            primary_diagnosis = _first_line(diagnosis.get("primary_diagnosis")),
+            medications = parse_medications(reports.get("medication_review"), reports.get("medical_diagnosis")),
+            disposition = parse_disposition(decision.get("disposition")),
+            timings = {task: totals["duration"] for task, totals in summary.items() if totals["duration"]},
+            duration = crew.trace.duration,
+            reused = [span["task"] for span in crew.trace.spans if span["kind"] == "task" and span.get("reused")],
+            degraded = [
+                f"{span['task']}: {span['degraded']}"
+                for span in crew.trace.spans
+                if span["kind"] == "task" and span.get("degraded")
+            ],
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_record(self):
+        """Flat row for columnar storage: one column per field, per-task report and per-task time."""
+        record = {name: value for name, value in asdict(self).items() if name not in ("reports", "timings")}
+        for task, report in self.reports.items():
+            if report != self.output:  # the final report is already the output column
+                record[f"{task}_report"] = report
+        for task, seconds in self.timings.items():
+            record[f"{task}_seconds"] = seconds
+        return record
+
+
+#*-----------------Writers-----------------*#
+
+# Column types of ERResult.to_record(), for writers that need a fixed schema
+RESULT_COLUMNS = dict(
+    request_id = "string",
+    symptoms = "string",
+    output = "string",
+    ktas_level = "int64",
+    provisional_ktas = "int64",
+    primary_diagnosis = "string",
+    medications = "list<string>",
+    disposition = "string",
+    duration = "float64",
+    reused = "list<string>",
+    degraded = "list<string>",
+    **{f"{task}_report": "string" for task in REPORT_FIELDS},
+    **{f"{task}_seconds": "float64" for task in REPORT_FIELDS},
+)
+
+_COERCE = {
+    "string": str,
+    "int64": int,
+    "float64": float,
+    "list<string>": lambda values: [str(value) for value in values],
+}
+
+
+class JSONLResultWriter:
+    """Writes records to a JSONL file, `buffer_size` records per write."""
+
+    def __init__(self, path, buffer_size=100, append=False):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record):
+        if hasattr(record, "to_record"):
+            record = record.to_record()
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+            self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetResultWriter:
+    """
+    Writes records to a Parquet file (pyarrow), one row group per `buffer_size`
+    records. The schema is fixed up front: RESULT_COLUMNS followed by `columns`
+    ({name: type}, types as in RESULT_COLUMNS) for anything the caller adds. Values
+    are converted to their column's type; a record with an unknown column is an error.
+    """
+
+    def __init__(self, path, buffer_size=1000, columns=None):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Writing Parquet needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.buffer_size = buffer_size
+        self.columns = dict(columns or {}, **RESULT_COLUMNS)
+        types = {
+            "string": pa.string(),
+            "int64": pa.int64(),
+            "float64": pa.float64(),
+            "list<string>": pa.list_(pa.string()),
+        }
+        self._schema = pa.schema([(name, types[kind]) for name, kind in self.columns.items()])
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def _row(self, record):
+        unknown = [name for name in record if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Columns {unknown} are not in the Parquet schema; pass them in `columns`")
+        return {
+            name: None if record.get(name) is None else _COERCE[kind](record[name])
+            for name, kind in self.columns.items()
+        }
+
+    def write(self, record):
+        if hasattr(record, "to_record"):
+            record = record.to_record()
+        record = self._row(record)
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._buffer:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self._schema))
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            self._flush()
+            if self._writer is None:  # no records: still write a file with the schema
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+WRITERS = {".jsonl": JSONLResultWriter, ".parquet": ParquetResultWriter}
+
+
+def open_writer(path, columns=None, **kwargs):
+    """
+    JSONL or Parquet result writer, chosen by the file extension. `columns` declares the
+    types of the columns added to ERResult records (see ParquetResultWriter).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported result format {extension!r}; use one of {sorted(WRITERS)}")
+    if extension == ".parquet":
+        kwargs["columns"] = columns
+    return WRITERS[extension](path, **kwargs)
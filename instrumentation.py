@@ -0,0 +1,393 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Per-request traces (JSONL) and process-wide aggregate metrics (Prometheus text format)
+# for tasks, agent iterations, LLM calls and tool calls. The active trace and task span
+# live in context variables; TaskScheduler copies the context into its worker threads,
+# so LLM callbacks, agent step callbacks and tools always find the right request.
+
+_current_trace = contextvars.ContextVar("er_trace", default=None)
+_current_span = contextvars.ContextVar("er_task_span", default=None)
+_retry_state = contextvars.ContextVar("er_retry_state", default=None)
+_active_llm = threading.local()  # span of the LLM call running in this thread
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+#*-----------------Metrics-----------------*#
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DURATION_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render_prometheus(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def write_prometheus(self, path):
+        """Write atomically, e.g. into a node_exporter textfile collector directory."""
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+
+METRICS = MetricsRegistry()
+REQUEST_SECONDS = METRICS.histogram("er_request_duration_seconds", "End-to-end EmergencyRoomQA request time.")
+TASK_SECONDS = METRICS.histogram("er_task_duration_seconds", "Wall time per crew task.", ("task",))
+LLM_SECONDS = METRICS.histogram("er_llm_call_duration_seconds", "Wall time per LLM call.", ("task", "model"))
+TOOL_SECONDS = METRICS.histogram("er_tool_call_duration_seconds", "Wall time per tool call.", ("task", "tool"))
+ITERATIONS = METRICS.histogram("er_agent_iterations", "Agent think/tool iterations per task.", ("task",), ITERATION_BUCKETS)
+TOKENS = METRICS.counter("er_llm_tokens_total", "LLM tokens by task and type (prompt/completion).", ("task", "type"))
+ERRORS = METRICS.counter("er_errors_total", "Failed LLM calls, tool calls and tasks.", ("kind", "task"))
+MAX_ITER_REACHED = METRICS.counter("er_agent_max_iter_reached_total", "Tasks whose agent used all max_iter iterations.", ("task",))
+DEGRADED = METRICS.counter("er_degraded_tasks_total", "Tasks stopped by their time or tool budget, by reason.", ("task", "reason"))
+ESCALATIONS = METRICS.counter("er_model_escalations_total", "Tasks redone on the large model, by reason.", ("task", "reason"))
+RETRIES = METRICS.counter(
+    "er_retries_total",
+    "Retries by kind: llm_client (HTTP retry in the model client), llm (LangChain retry), "
+    "agent (agent called the LLM again after a failed call), tool (same tool call after a failure).",
+    ("kind", "task"),
+)
+
+
+#*-----------------Traces-----------------*#
+
+_write_lock = threading.Lock()
+
+
+class RequestTrace:
+    """Spans of one request: one per task, LLM call and tool call."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.time()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def activate(self):
+        token = _current_trace.set(self)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+            self.duration = time.perf_counter() - start
+            REQUEST_SECONDS.observe(self.duration)
+
+    def summary(self):
+        """Per-task totals: wall time, iterations, LLM/tool calls and time, tokens, errors, retries."""
+        tasks = {}
+        for span in self.spans:
+            totals = tasks.setdefault(span["task"], dict(
+                duration=0.0, iterations=0, llm_calls=0, llm_seconds=0.0, tool_calls=0,
+                tool_seconds=0.0, prompt_tokens=0, completion_tokens=0, errors=0, retries=0,
+            ))
+            if span.get("error"):
+                totals["errors"] += 1
+            if span["kind"] == "task":
+                totals["duration"] += span["duration"]
+                totals["iterations"] += span.get("iterations", 0)
+                totals["retries"] += span.get("retries", 0)
+            elif span["kind"] == "llm":
+                totals["llm_calls"] += 1
+                totals["llm_seconds"] += span["duration"]
+                totals["prompt_tokens"] += span.get("prompt_tokens", 0)
+                totals["completion_tokens"] += span.get("completion_tokens", 0)
+            elif span["kind"] == "tool":
+                totals["tool_calls"] += 1
+                totals["tool_seconds"] += span["duration"]
+        return tasks
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return dict(
+            request_id=self.request_id,
+            started=self.started,
+            duration=self.duration,
+            summary=self.summary(),
+            spans=spans,
+        )
+
+    def write_jsonl(self, path):
+        line = json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+        with _write_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _new_span(kind, name, task):
+    trace = _current_trace.get()
+    offset = time.time() - trace.started if trace is not None else 0.0
+    return dict(kind=kind, name=name, task=task, start=round(offset, 6), duration=None)
+
+
+def current_task():
+    """Name of the task whose span is active in this context, or ''."""
+    span = _current_span.get()
+    return span["task"] if span is not None else ""
+
+
+def record_retry(kind, llm_span=None):
+    """Count one retry against the current task (and the LLM call it happened in, if any)."""
+    span = _current_span.get()
+    task = span["task"] if span is not None else ""
+    RETRIES.inc(kind=kind, task=task)
+    if span is not None:
+        span["retries"] += 1
+    llm_span = llm_span or getattr(_active_llm, "span", None)
+    if llm_span is not None:
+        llm_span["retries"] = llm_span.get("retries", 0) + 1
+
+
+@contextlib.contextmanager
+def task_span(task, max_iter=None):
+    """Time a crew task; agent steps and LLM/tool calls made inside are attributed to it."""
+    span = _new_span("task", task, task)
+    span.update(iterations=0, max_iter=max_iter, retries=0)
+    token = _current_span.set(span)
+    # failures seen so far, to tell a retry from a first call
+    state_token = _retry_state.set(dict(llm_failed=False, failed_tools=set()))
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["error"] = repr(e)
+        ERRORS.inc(kind="task", task=task)
+        raise
+    finally:
+        _current_span.reset(token)
+        _retry_state.reset(state_token)
+        span["duration"] = time.perf_counter() - start
+        TASK_SECONDS.observe(span["duration"], task=task)
+        ITERATIONS.observe(span["iterations"], task=task)
+        if max_iter and span["iterations"] >= max_iter:
+            span["max_iter_reached"] = True
+            MAX_ITER_REACHED.inc(task=task)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(span)
+
+
+@contextlib.contextmanager
+def tool_span(tool, query=None):
+    """Time one tool call."""
+    task = current_task()
+    span = _new_span("tool", tool, task)
+    if query is not None:
+        span["query"] = query
+    state = _retry_state.get()
+    if state is not None and (tool, query) in state["failed_tools"]:
+        span["retry"] = True
+        record_retry("tool")
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["error"] = repr(e)
+        ERRORS.inc(kind="tool", task=task)
+        if state is not None:
+            state["failed_tools"].add((tool, query))
+        raise
+    finally:
+        span["duration"] = time.perf_counter() - start
+        TOOL_SECONDS.observe(span["duration"], task=task, tool=tool)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(span)
+
+
+def record_agent_step(step_output):
+    """crewAI Agent step_callback: counts think/tool iterations of the current task."""
+    span = _current_span.get()
+    if span is not None:
+        span["iterations"] += 1
+
+
+#*-----------------LLM callback-----------------*#
+
+class TraceCallback(BaseCallbackHandler):
+    """
+    LangChain callback recording every LLM call (wall time, token usage, errors) into
+    the active trace and the aggregate metrics. One instance serves all requests.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _start(self, serialized, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "")
+        span = _new_span("llm", model, current_task())
+        span["retries"] = 0
+        state = _retry_state.get()
+        if state is not None and state["llm_failed"]:
+            # the previous LLM call of this task failed and the agent is calling again
+            state["llm_failed"] = False
+            record_retry("agent", span)
+        _active_llm.span = span
+        with self._lock:
+            self._calls[run_id] = (span, _current_trace.get(), time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def _finish(self, run_id):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return None
+        span, trace, start = call
+        if getattr(_active_llm, "span", None) is span:
+            _active_llm.span = None
+        span["duration"] = time.perf_counter() - start
+        LLM_SECONDS.observe(span["duration"], task=span["task"], model=span["name"])
+        if trace is not None:
+            trace.add(span)
+        return span
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        span["prompt_tokens"] = usage.get("prompt_tokens", 0)
+        span["completion_tokens"] = usage.get("completion_tokens", 0)
+        TOKENS.inc(span["prompt_tokens"], task=span["task"], type="prompt")
+        TOKENS.inc(span["completion_tokens"], task=span["task"], type="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is not None:
+            span["error"] = repr(error)
+            ERRORS.inc(kind="llm", task=span["task"])
+        state = _retry_state.get()
+        if state is not None:
+            state["llm_failed"] = True
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.get(run_id)
+        record_retry("llm", call[0] if call is not None else None)
+
+
+TRACE_CALLBACK = TraceCallback()
+
+
+class ClientRetryHandler(logging.Handler):
+    """Counts the HTTP retries the Groq/OpenAI SDK clients make inside one LLM call (they only log them)."""
+
+    LOGGERS = ("groq._base_client", "openai._base_client")
+
+    def emit(self, record):
+        if record.getMessage().startswith("Retrying request"):
+            record_retry("llm_client")
+
+
+CLIENT_RETRY_HANDLER = ClientRetryHandler(logging.INFO)
+
+
+def _watch_client_retries():
+    for name in ClientRetryHandler.LOGGERS:
+        logger = logging.getLogger(name)
+        if CLIENT_RETRY_HANDLER not in logger.handlers:
+            logger.addHandler(CLIENT_RETRY_HANDLER)
+            if logger.getEffectiveLevel() > logging.INFO:
+                logger.setLevel(logging.INFO)
+
+
+def instrument_llm(llm):
+    """Add TRACE_CALLBACK to a LangChain model's callbacks (once) and return it."""
+    _watch_client_retries()
+    callbacks = llm.callbacks if isinstance(llm.callbacks, list) else []
+    if TRACE_CALLBACK not in callbacks:
+        callbacks.append(TRACE_CALLBACK)
+    llm.callbacks = callbacks
+    return llm
@@ -0,0 +1,461 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+# Durable local job queue (SQLite) and a multi-process worker pool for EmergencyRoomQA.
+# Patient cases are enqueued once; each worker process keeps a warm EmergencyRoomQA
+# (LLM clients, embedder, RxNorm indexes) and leases jobs from the queue. A lease
+# expires unless its worker keeps renewing it, so jobs of a crashed worker are picked up
+# again; results are written back to the same database and exported from there.
+#
+#   python job_queue.py enqueue jobs.sqlite patients.csv
+#   python job_queue.py work jobs.sqlite --workers 8
+#   python job_queue.py status jobs.sqlite
+#   python job_queue.py export jobs.sqlite results.parquet
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0  # seconds between lease attempts of an idle worker
+MAX_RESTARTS_PER_WORKER = 3
+RESTART_DELAY = 2.0  # seconds before the first restart of a worker, doubled per failure
+MAX_RESTART_DELAY = 60.0
+
+STATUSES = ("queued", "leased", "done", "failed")
+
+
+@dataclass
+class Job:
+    id: int
+    key: str
+    symptoms: str
+    attempts: int
+
+
+#*-----------------Queue-----------------*#
+
+class JobQueue:
+    """
+    Jobs in a SQLite database shared by any number of processes. Leasing happens in an
+    IMMEDIATE transaction, so two workers never get the same job.
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, symptoms TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_owner TEXT, lease_expires REAL, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; multi-statement updates use explicit transactions
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def enqueue(self, symptoms, key=None):
+        """Add a job; a job with the same key is left as it is. Returns its key."""
+        return self.enqueue_many([(key, symptoms)])[0]
+
+    def enqueue_many(self, items):
+        """Add `(key, symptoms)` pairs (key None: a new unique key) in one transaction."""
+        now = time.time()
+        keys = []
+        conn = self._transaction()
+        try:
+            for key, symptoms in items:
+                key = str(key) if key is not None else uuid.uuid4().hex
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (key, symptoms, created, updated) VALUES (?, ?, ?, ?)",
+                    (key, symptoms, now, now),
+                )
+                keys.append(key)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return keys
+
+    def lease(self, owner):
+        """The oldest runnable job, leased to `owner`, or None."""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            # leases that ran out on their last attempt will not be retried
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_owner = NULL, updated = ?"
+                " WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id, key, symptoms, attempts FROM jobs"
+                " WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?)"
+                " ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated = ?"
+                " WHERE id = ?",
+                (owner, now + self.lease_seconds, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Job(id=row[0], key=row[1], symptoms=row[2], attempts=row[3] + 1)
+
+    def renew(self, job_id, owner):
+        """Extend a lease; False if `owner` no longer holds it."""
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + self.lease_seconds, now, job_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, owner, result):
+        """Store the result of a leased job; False if the lease was lost to another worker."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated = ?"
+            " WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False, default=str), time.time(), job_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error):
+        """Give a leased job back for a retry, or mark it failed after max_attempts."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+            " error = ?, lease_owner = NULL, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (self.max_attempts, str(error), time.time(), job_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, owner_prefix, error="worker died", count_attempt=True):
+        """
+        Re-queue the leases of a dead worker right away instead of waiting for them to
+        expire. With `count_attempt=False` (a worker that was stopped, not one that failed)
+        the interrupted attempt is given back.
+        """
+        refund = 0 if count_attempt else 1
+        cursor = self._connect().execute(
+            "UPDATE jobs SET attempts = attempts - ?,"
+            " status = CASE WHEN attempts - ? >= ? THEN 'failed' ELSE 'queued' END,"
+            " error = ?, lease_owner = NULL, updated = ?"
+            " WHERE status = 'leased' AND substr(lease_owner, 1, ?) = ?",
+            (refund, refund, self.max_attempts, error, time.time(), len(owner_prefix), owner_prefix),
+        )
+        return cursor.rowcount
+
+    def requeue_failed(self):
+        """Give every failed job a fresh set of attempts."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, updated = ? WHERE status = 'failed'", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for status, n in self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = n
+        return counts
+
+    def pending(self):
+        """Jobs not finished yet (queued or leased)."""
+        counts = self.counts()
+        return counts["queued"] + counts["leased"]
+
+    def results(self):
+        """(key, status, attempts, result dict or None, error) of every job, in enqueue order."""
+        rows = self._connect().execute("SELECT key, status, attempts, result, error FROM jobs ORDER BY id")
+        for key, status, attempts, result, error in rows:
+            yield key, status, attempts, json.loads(result) if result else None, error
+
+
+#*-----------------Workers-----------------*#
+
+def worker_owner(worker_id, pid):
+    """Lease owner prefix of worker `worker_id` running as process `pid` on this host."""
+    return f"{worker_id}:{socket.gethostname()}:{pid}:"
+
+
+def _renew_leases(queue, job, owner, stop):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(job.id, owner):
+            return
+
+
+def _work(queue, qa, owner, exit_when_empty, leased=None):
+    while True:
+        job = queue.lease(owner)
+        if job is None:
+            if exit_when_empty and queue.pending() == 0:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        if leased is not None:
+            leased.set()
+        stop = threading.Event()
+        renewer = threading.Thread(target=_renew_leases, args=(queue, job, owner, stop), daemon=True)
+        renewer.start()
+        started = time.time()
+        try:
+            result = qa.get_er_result(job.symptoms, request_id=f"job-{job.key}-{job.attempts}")
+        except Exception as e:
+            print(f"[{owner}] job {job.key}: attempt {job.attempts} failed: {e}")
+            queue.fail(job.id, owner, e)
+        else:
+            degraded = getattr(result, "degraded", None)
+            if degraded and job.attempts < queue.max_attempts:
+                # a best-effort answer is retried; on the last attempt it is kept as it is
+                print(f"[{owner}] job {job.key}: attempt {job.attempts} degraded")
+                queue.fail(job.id, owner, f"degraded: {'; '.join(degraded)}")
+                continue
+            record = result.to_record() if hasattr(result, "to_record") else dict(output=str(result))
+            record["elapsed"] = time.time() - started
+            if not queue.complete(job.id, owner, record):
+                print(f"[{owner}] job {job.key}: lease lost, result discarded")
+        finally:
+            stop.set()
+
+
+def worker_main(path, worker_id, threads=1, lease_seconds=DEFAULT_LEASE_SECONDS,
+                max_attempts=DEFAULT_MAX_ATTEMPTS, qa_kwargs=None, rpm=None, tpm=None, exit_when_empty=True,
+                leased=None, small_rpm=None, small_tpm=None):
+    """
+    Entry point of one worker process: warm everything up once, then lease and run jobs
+    on `threads` threads sharing one EmergencyRoomQA until the queue is drained.
+    `leased` (an Event) is set once the worker has got its first job. `rpm`/`tpm` limit
+    the large model and `small_rpm`/`small_tpm` the small routing model.
+    """
+    import crewai_240721 as er
+
+    er.warm_up()
+    index = er.get_rxnorm_index()
+    if index is not None:
+        index.embed_query("warm up")  # load the embedder before the first job
+    # no per-task budgets by default: waiting for the rate limiter would count against them
+    qa = er.EmergencyRoomQA(**{"task_budgets": False, **(qa_kwargs or {})})
+    if rpm or tpm:
+        from batch_runner import GroqRateLimiter
+        GroqRateLimiter(rpm, tpm).attach(qa.llm)
+    if small_rpm or small_tpm:
+        from batch_runner import GroqRateLimiter
+        GroqRateLimiter(small_rpm, small_tpm).attach(er.get_small_llm())
+
+    queue = JobQueue(path, lease_seconds, max_attempts)
+    owner = worker_owner(worker_id, os.getpid())
+    pool = [
+        threading.Thread(target=_work, args=(queue, qa, f"{owner}{i}", exit_when_empty, leased), name=f"er-job-{i}")
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+class WorkerPool:
+    """
+    Runs `workers` worker processes against the queue at `path` until it is drained.
+    A worker that dies has its jobs re-queued and is replaced after a backoff, up to
+    `max_restarts` replacements in total (default: MAX_RESTARTS_PER_WORKER per worker).
+    A worker dying before any worker leased a job is a startup failure (missing API key,
+    missing dependency, ...): the pool stops and raises RuntimeError.
+    """
+
+    def __init__(self, path, workers=None, threads=1, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, qa_kwargs=None, rpm=None, tpm=None, progress_interval=30.0,
+                 max_restarts=None, small_rpm=None, small_tpm=None):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.max_restarts = max_restarts if max_restarts is not None else self.workers * MAX_RESTARTS_PER_WORKER
+        self.threads = threads
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.qa_kwargs = qa_kwargs or {}
+        # Groq quotas are per API key and model, so every worker gets an equal share of each
+        self.rpm = rpm / self.workers if rpm else None
+        self.tpm = tpm / self.workers if tpm else None
+        self.small_rpm = small_rpm / self.workers if small_rpm else None
+        self.small_tpm = small_tpm / self.workers if small_tpm else None
+        self.progress_interval = progress_interval
+        # spawn: workers must not inherit the parent's threads, locks or sockets
+        self._context = multiprocessing.get_context("spawn")
+
+    def _start(self, worker_id):
+        leased = self._context.Event()
+        process = self._context.Process(
+            target=worker_main,
+            args=(self.path, worker_id, self.threads, self.lease_seconds, self.max_attempts,
+                  self.qa_kwargs, self.rpm, self.tpm, True, leased),
+            kwargs=dict(small_rpm=self.small_rpm, small_tpm=self.small_tpm),
+            name=f"er-worker-{worker_id}",
+        )
+        process.start()
+        return process, leased
+
+    def run(self):
+        queue = JobQueue(self.path, self.lease_seconds, self.max_attempts)
+        processes = {worker_id: self._start(worker_id) for worker_id in range(self.workers)}
+        failures = dict.fromkeys(processes, 0)  # consecutive deaths per worker, for the backoff
+        restart_at = {}  # worker_id -> time its replacement starts
+        restarts = 0
+        any_leased = False
+        last_progress = 0.0
+        try:
+            while processes or restart_at:
+                time.sleep(1.0)
+                any_leased = any_leased or any(leased.is_set() for _, leased in processes.values())
+                for worker_id, (process, leased) in list(processes.items()):
+                    if process.is_alive():
+                        continue
+                    del processes[worker_id]
+                    if process.exitcode == 0:
+                        continue
+                    released = queue.release(worker_owner(worker_id, process.pid))
+                    print(f"Worker {worker_id} died (exit code {process.exitcode}); {released} job(s) re-queued")
+                    if not any_leased:
+                        raise RuntimeError(
+                            f"Worker {worker_id} exited with code {process.exitcode} before any job was leased; "
+                            "check its output (GROQ_API_KEY, installed dependencies) before running the pool again"
+                        )
+                    failures[worker_id] = 1 if leased.is_set() else failures[worker_id] + 1
+                    if not queue.pending():
+                        continue
+                    if restarts >= self.max_restarts:
+                        print(f"Restart budget ({self.max_restarts}) used up; worker {worker_id} is not replaced")
+                        continue
+                    restarts += 1
+                    delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** (failures[worker_id] - 1))
+                    restart_at[worker_id] = time.time() + delay
+                for worker_id, at in list(restart_at.items()):
+                    if time.time() >= at:
+                        del restart_at[worker_id]
+                        processes[worker_id] = self._start(worker_id)
+                if time.time() - last_progress >= self.progress_interval:
+                    last_progress = time.time()
+                    print(f"Queue {self.path}: {queue.counts()}")
+        finally:
+            for process, _ in processes.values():
+                process.terminate()
+            for worker_id, (process, _) in processes.items():
+                process.join()
+                # stopped, not failed: their jobs go back to the queue without using up an attempt
+                queue.release(worker_owner(worker_id, process.pid), error="worker stopped", count_attempt=False)
+        counts = queue.counts()
+        print(f"Queue {self.path}: {counts}")
+        return counts
+
+
+#*-----------------Export-----------------*#
+
+def export_results(path, output_file):
+    """Write every job as one row (key, status, attempts, error, parsed result fields) to JSONL or Parquet."""
+    from er_result import open_writer
+
+    queue = JobQueue(path)
+    n = 0
+    columns = dict(key="string", status="string", attempts="int64", error="string", elapsed="float64")
+    with open_writer(output_file, columns=columns) as writer:
+        for key, status, attempts, result, error in queue.results():
+            row = dict(key=key, status=status, attempts=attempts, error=error)
+            row.update(result or {})
+            writer.write(row)
+            n += 1
+    print(f"{n} jobs exported to {output_file}")
+    return n
+
+
+#*-----------------CLI-----------------*#
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durable job queue and worker pool for EmergencyRoomQA.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add the rows of a CSV file as jobs")
+    enqueue.add_argument("queue")
+    enqueue.add_argument("input_file")
+    enqueue.add_argument("--input-column", default="input")
+
+    work = commands.add_parser("work", help="run worker processes until the queue is drained")
+    work.add_argument("queue")
+    work.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    work.add_argument("--threads", type=int, default=1, help="concurrent jobs per process")
+    work.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work.add_argument("--rpm", type=int, help="LLM requests per minute for all workers together")
+    work.add_argument("--tpm", type=int, help="LLM tokens per minute for all workers together")
+    work.add_argument("--small-rpm", type=int, help="requests per minute of the small routing model, all workers")
+    work.add_argument("--small-tpm", type=int, help="tokens per minute of the small routing model, all workers")
+    work.add_argument("--retry-failed", action="store_true", help="re-queue failed jobs first")
+    work.add_argument("--max-restarts", type=int, help="replacements for dead workers in total "
+                      f"(default: {MAX_RESTARTS_PER_WORKER} per worker)")
+
+    status = commands.add_parser("status", help="job counts by status")
+    status.add_argument("queue")
+
+    export = commands.add_parser("export", help="write results to a .jsonl or .parquet file")
+    export.add_argument("queue")
+    export.add_argument("output_file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        from batch_runner import read_csv_with_encoding
+
+        df = read_csv_with_encoding(args.input_file)
+        items = [(int(index), text) for index, text in df[args.input_column].items()
+                 if isinstance(text, str) and text.strip()]
+        JobQueue(args.queue).enqueue_many(items)
+        print(f"{len(items)} jobs enqueued in {args.queue}")
+    elif args.command == "work":
+        queue = JobQueue(args.queue, args.lease_seconds, args.max_attempts)
+        if args.retry_failed:
+            print(f"{queue.requeue_failed()} failed jobs re-queued")
+        WorkerPool(
+            args.queue,
+            workers=args.workers,
+            threads=args.threads,
+            lease_seconds=args.lease_seconds,
+            max_attempts=args.max_attempts,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            small_rpm=args.small_rpm,
+            small_tpm=args.small_tpm,
+            max_restarts=args.max_restarts,
+        ).run()
+    elif args.command == "status":
+        print(JobQueue(args.queue).counts())
+    elif args.command == "export":
+        export_results(args.queue, args.output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = "./.llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# readwrite: serve hits, call the model and store on a miss
+# record:    always call the model and overwrite the stored response
+# replay:    serve hits only; a miss raises CacheMissError instead of calling the model
+CACHE_MODES = ("readwrite", "record", "replay")
+
+
+class CacheMissError(LookupError):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+
+#*-----------------Cache-----------------*#
+
+class SQLiteLLMCache(BaseCache):
+    """
+    On-disk LangChain LLM cache with size-bounded LRU eviction.
+
+    LangChain calls `lookup`/`update` with the serialized message list as
+    `prompt` and the model name, sampling parameters and stop words as
+    `llm_string`, so an entry is keyed on all of them. The database is shared
+    safely between threads (one connection each) and between processes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, mode="readwrite", max_bytes=DEFAULT_MAX_BYTES):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        if self.mode == "record":
+            return None
+        key = self._key(prompt, llm_string)
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMissError(f"No recorded LLM response for prompt {key[:12]} in {self.path}")
+            return None
+        if self.mode != "replay":
+            with conn:
+                conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return loads(row[0])
+
+    def update(self, prompt, llm_string, return_val):
+        if self.mode == "replay":
+            return
+        value = dumps(return_val)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed"):
+            stale.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+
+    def clear(self, **kwargs):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+
+
+def with_cache(llm, cache):
+    """Attach `cache` to a LangChain chat model in place and return it."""
+    llm.cache = cache
+    return llm
+
+
+def cache_from_env():
+    """
+    Build the cache configured by ER_LLM_CACHE (database path) and
+    ER_LLM_CACHE_MODE (readwrite/record/replay); None when caching is off.
+    """
+    path = os.getenv("ER_LLM_CACHE")
+    if not path:
+        return None
+    return SQLiteLLMCache(path, mode=os.getenv("ER_LLM_CACHE_MODE", "readwrite"))
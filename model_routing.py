@@ -0,0 +1,65 @@
+import re
+
+from context_compaction import REQUIRED_FIELDS, missing_fields
+from streaming import ktas_level
+
+# Tiered model selection per task. Routine stages start on the small model and are redone
+# on the large one when their output is unusable (empty, hit the iteration limit, missing
+# the report format, hedging) or when triage finds a high-acuity patient. Only patients
+# pre-triaged as KTAS 4-5 start on the small model at all.
+
+SMALL = "small"
+LARGE = "large"
+
+# task -> tier it starts on; tasks not listed always run on LARGE
+DEFAULT_ROUTES = dict(
+    medication_review = SMALL,
+    triage_assessment = SMALL,
+)
+
+# KTAS levels that are never left to the small model
+ESCALATION_KTAS = (1, 2, 3)
+
+LOW_CONFIDENCE_RE = re.compile(
+    r"agent stopped due to iteration limit|i (?:do not|don't) know|i am not sure|i'm not sure|"
+    r"unable to (?:determine|assess|provide)|cannot (?:determine|assess|be determined)|insufficient information",
+    re.IGNORECASE,
+)
+
+
+class ModelRouter:
+    """Chooses the starting tier of each task and decides when a small-model answer is escalated."""
+
+    def __init__(self, routes=None, escalation_ktas=ESCALATION_KTAS, required_fields=None):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.escalation_ktas = tuple(escalation_ktas)
+        self.required_fields = dict(REQUIRED_FIELDS if required_fields is None else required_fields)
+
+    def initial_tier(self, task, provisional=None):
+        """
+        Tier `task` starts on; `provisional` is the pre_triage.PreTriageResult, if any.
+        No pre-triage, or one that matched no rule, is no evidence of a routine case.
+        """
+        tier = self.routes.get(task, LARGE)
+        if tier == SMALL and (provisional is None or provisional.level is None or provisional.level in self.escalation_ktas):
+            return LARGE
+        return tier
+
+    def escalation_reason(self, task, output, max_iter_reached=False):
+        """Why a small-model output of `task` has to be redone on the large model, or None."""
+        if not output or not output.strip():
+            return "empty output"
+        if max_iter_reached:
+            return "iteration limit"
+        if LOW_CONFIDENCE_RE.search(output):
+            return "low confidence"
+        missing = missing_fields(task, output, self.required_fields.get(task, ()))
+        if missing:
+            return f"parse failure: missing {', '.join(missing)}"
+        if task == "triage_assessment":
+            level = ktas_level(output)
+            if level is None:
+                return "parse failure: no KTAS level"
+            if level in self.escalation_ktas:
+                return f"KTAS {level}"
+        return None
@@ -0,0 +1,202 @@
+import re
+from dataclasses import dataclass, field
+
+# Rule-based provisional KTAS level computed from the free-text symptoms in a few
+# milliseconds, before the crew runs. It only flags cases early; the triage nurse
+# agent still assigns the KTAS level of record.
+
+
+#*-----------------Vitals-----------------*#
+
+_NUMBER = r"(\d{1,3}(?:\.\d+)?)"
+# "2 hr 30 min" is a duration, not a heart rate of 30
+_NOT_DURATION = r"(?!\s*(?:min(?:ute)?s?|h(?:ou)?rs?|h|sec(?:ond)?s?|days?|weeks?)\b)"
+
+VITAL_PATTERNS = dict(
+    systolic_bp = re.compile(r"\b(?:bp|blood pressure)\s*(?:of|:|was|is)?\s*(\d{2,3})\s*/\s*\d{2,3}", re.I),
+    heart_rate = re.compile(
+        r"(?:\b(?:heart rate|pulse(?: rate)?)\s*(?:of|:|was|is)?\s*" + _NUMBER + _NOT_DURATION +
+        r"|(?<!\d)(?<!\d )\bhr\s*(?:of|:|=|was|is)?\s*" + _NUMBER + r"(?=\s*(?:bpm|beats|/\s*min)\b)"
+        r"|(?<!\d)(?<!\d )\bhr\s*(?:of|:|=|was|is)?\s*" + _NUMBER + _NOT_DURATION + r"(?!\s*\d))",
+        re.I,
+    ),
+    respiratory_rate = re.compile(r"\b(?:rr|respiratory rate|resp(?:iratory)?\.? rate)\s*(?:of|:|was|is)?\s*" + _NUMBER + _NOT_DURATION, re.I),
+    temperature = re.compile(r"\b(?:temp(?:erature)?|bt)\s*(?:of|:|was|is)?\s*" + _NUMBER + r"\s*(?:°|deg(?:rees?)?)?\s*([cf])?\b", re.I),
+    spo2 = re.compile(r"\b(?:spo2|sao2|o2 sat(?:uration)?|oxygen saturation|saturation)\s*(?:of|:|was|is)?\s*" + _NUMBER + r"\s*%?", re.I),
+    gcs = re.compile(r"\b(?:gcs|glasgow coma scale)\s*(?:score)?\s*(?:of|:|was|is)?\s*(\d{1,2})\b", re.I),
+)
+_SPO2_TRAILING = re.compile(_NUMBER + r"\s*%\s*(?:on|at)?\s*(?:room air|ra)\b", re.I)
+
+
+def _celsius(value, unit):
+    # explicit °F, or a reading no Celsius temperature can have
+    if (unit or "").lower() == "f" or (not unit and value > 45):
+        return round((value - 32) * 5 / 9, 1)
+    return value
+
+
+def extract_vitals(text):
+    """Return {vital_name: float} for every vital sign found in `text`; temperatures in °C."""
+    vitals = {}
+    for name, pattern in VITAL_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            vitals[name] = float(next(group for group in match.groups() if group))
+            if name == "temperature":
+                vitals[name] = _celsius(vitals[name], match.group(2))
+    if "spo2" not in vitals:
+        match = _SPO2_TRAILING.search(text)
+        if match:
+            vitals["spo2"] = float(match.group(1))
+    return vitals
+
+
+#*-----------------Rules-----------------*#
+
+# Key phrases per KTAS level, taken from the examples in the triage_assessment KTAS guide
+# plus common synonyms. Each entry is (criterion, regex).
+PHRASE_RULES = {
+    1: [
+        ("cardiac arrest", r"cardiac arrest|pulseless|asystole|ventricular fibrillation|\bv-?fib\b|no pulse|\bcpr\b"),
+        ("respiratory arrest", r"respiratory arrest|apn(?:o)?ea|not breathing|agonal breathing"),
+        ("unconsciousness", r"unconscious|unresponsive|comatose|\bcoma\b"),
+        ("major hemorrhage / shock", r"massive (?:bleeding|hemorrhage|haemorrhage)|hemorrhagic shock|septic shock|\bshock\b"),
+    ],
+    2: [
+        ("myocardial infarction", r"myocardial infarction|\bstemi\b|\bnstemi\b|heart attack|crushing chest pain|st[- ]elevation"),
+        ("cerebral hemorrhage", r"cerebral (?:hemorrhage|haemorrhage)|intracranial (?:hemorrhage|bleed)|subarachnoid"),
+        ("cerebral infarction", r"cerebral infarction|\bstroke\b|hemiparesis|facial droop|slurred speech|aphasia"),
+        ("chest pain", r"chest pain"),
+        ("seizure", r"seizure|convuls"),
+        ("anaphylaxis", r"anaphyla"),
+        ("altered mental status", r"altered mental|confus(?:ed|ion)|disorient"),
+        ("severe respiratory distress", r"severe (?:respiratory distress|dyspn(?:o)?ea|breathlessness)|rapid shallow breathing"),
+    ],
+    3: [
+        ("dyspnea", r"dyspn(?:o)?ea|shortness of breath|breathless|difficulty breathing|respiratory distress"),
+        ("bloody diarrhea", r"(?:bloody|bleeding|blood in(?: the)?) (?:diarrh(?:o)?ea|stool)|hematochezia|melena"),
+        ("requires oxygen", r"\d+\s*l/min|oxygen (?:therapy|supplement)|required oxygen|requiring oxygen"),
+        ("persistent vomiting", r"persistent vomiting|intractable vomiting|hematemesis"),
+    ],
+    4: [
+        ("gastroenteritis with fever", r"gastroenteritis.*fever|fever.*gastroenteritis"),
+        ("urinary tract infection with abdominal pain", r"(?:urinary tract infection|\buti\b).*abdominal pain|abdominal pain.*(?:urinary tract infection|\buti\b)"),
+        ("fever", r"\bfever|febrile|pyrexia"),
+        ("abdominal pain", r"abdominal pain"),
+    ],
+    5: [
+        ("common cold", r"common cold|runny nose|rhinorrh(?:o)?ea|sore throat|nasal congestion"),
+        ("gastroenteritis", r"gastroenteritis"),
+        ("diarrhea", r"diarrh(?:o)?ea"),
+        ("laceration", r"laceration|minor (?:cut|wound)|abrasion"),
+    ],
+}
+
+COMPILED_PHRASE_RULES = [
+    (level, criterion, re.compile(pattern, re.I))
+    for level, rules in sorted(PHRASE_RULES.items())
+    for criterion, pattern in rules
+]
+
+# (level, criterion, predicate over the extracted vitals)
+VITAL_RULES = [
+    (1, "SpO2 < 80%", lambda v: v.get("spo2", 100) < 80),
+    (1, "systolic BP < 70 mmHg", lambda v: v.get("systolic_bp", 120) < 70),
+    (1, "GCS <= 8", lambda v: v.get("gcs", 15) <= 8),
+    (1, "heart rate < 40 or > 150", lambda v: "heart_rate" in v and not 40 <= v["heart_rate"] <= 150),
+    (2, "SpO2 < 90%", lambda v: v.get("spo2", 100) < 90),
+    (2, "systolic BP < 90 mmHg", lambda v: v.get("systolic_bp", 120) < 90),
+    (2, "respiratory rate > 30 or < 8", lambda v: "respiratory_rate" in v and not 8 <= v["respiratory_rate"] <= 30),
+    (2, "heart rate > 130", lambda v: v.get("heart_rate", 80) > 130),
+    (2, "GCS 9-13", lambda v: 9 <= v.get("gcs", 15) <= 13),
+    (2, "temperature >= 40°C", lambda v: v.get("temperature", 37) >= 40),
+    (3, "SpO2 90-94%", lambda v: 90 <= v.get("spo2", 100) < 95),
+    (3, "respiratory rate > 24", lambda v: v.get("respiratory_rate", 16) > 24),
+    (3, "heart rate > 110", lambda v: v.get("heart_rate", 80) > 110),
+    (4, "temperature >= 38°C", lambda v: v.get("temperature", 37) >= 38),
+]
+
+# words that end a negation, history or family-history scope: what follows is about the
+# patient's current presentation again
+_SCOPE_END = (
+    r"(?!\b(?:but|however|although|though|yet|except|now|today|currently|presents?|presenting|presented|"
+    r"arrived|brought|admitted|reports?|reporting|complains?|complaining|c/o|states|says)\b)"
+)
+_NEGATION = r"\b(?:no|not|denies|denied|without|negative for|absence of|ruled out|rules out|free of)\b"
+_NEGATION_RE = re.compile(_NEGATION + r"[^.;,]{0,25}$", re.I)
+# "denies fever, chills, or chest pain": the negation runs through a list of short items
+# joined by commas and closed by or/nor/and, before or after the matched item
+_NEGATED_LIST_RE = re.compile(
+    _NEGATION + r"(?:(?:" + _SCOPE_END + r"[^.;:,\n]){1,30},)+(?:" + _SCOPE_END + r"[^.;:,\n]){0,25}$",
+    re.I,
+)
+_CONJUNCTION_RE = re.compile(r"\b(?:or|nor|and)\b", re.I)
+_LIST_CLOSED_AFTER_RE = re.compile(r"^\s*(?:,\s*[^.;:,\n]{1,30})*,?\s*(?:or|nor|and)\s", re.I)
+# past events: discharge summaries list them next to the current presentation
+_HISTORY_BEFORE_RE = re.compile(
+    r"(?:\b(?:history of|hx of|h/o|past medical history|pmh|previous|prior|s/p|status post|treated for|"
+    r"recovered from|remote)\b|\bhx\s*:)"
+    r"(?:" + _SCOPE_END + r"[^.;\n]){0,60}$",
+    re.I,
+)
+# events of relatives: "mother had a heart attack", "family history of stroke"
+_FAMILY_BEFORE_RE = re.compile(
+    r"\b(?:family history|fhx|fh|mother|father|parents?|sister|brother|siblings?|grand(?:mother|father|parents?)|"
+    r"aunt|uncle|cousin)(?:'s)?\b"
+    r"(?:" + _SCOPE_END + r"[^.;\n]){0,60}$",
+    re.I,
+)
+_HISTORY_AFTER_RE = re.compile(r"^[^.;,\n]{0,20}?\b(?:(?:in|since) (?:19|20)\d{2}|\d+ (?:months?|years?) ago)\b", re.I)
+
+
+def _negated(before, after):
+    if _NEGATION_RE.search(before[-40:]):
+        return True
+    listed = _NEGATED_LIST_RE.search(before)
+    return bool(listed and (_CONJUNCTION_RE.search(listed.group()) or _LIST_CLOSED_AFTER_RE.search(after)))
+
+
+def _affirmed(pattern, text):
+    """True if `pattern` occurs in `text` at least once, not negated and not as past or family history."""
+    for m in pattern.finditer(text):
+        before, after = text[max(0, m.start() - 120):m.start()], text[m.end():m.end() + 40]
+        if not (_negated(before, after) or _HISTORY_BEFORE_RE.search(before) or _FAMILY_BEFORE_RE.search(before)
+                or _HISTORY_AFTER_RE.search(after)):
+            return True
+    return False
+
+
+# Levels that are flagged for immediate attention while the crew refines the result.
+URGENT_LEVELS = (1, 2)
+# No rule matched: the level is undetermined rather than the least urgent one.
+UNDETERMINED_LEVEL = None
+
+
+@dataclass
+class PreTriageResult:
+    level: int  # UNDETERMINED_LEVEL (None) when no rule matched
+    criteria: list = field(default_factory=list)  # [(level, criterion)] of every rule that matched
+    vitals: dict = field(default_factory=dict)
+
+    @property
+    def urgent(self):
+        return self.level in URGENT_LEVELS
+
+    @property
+    def determined(self):
+        return self.level is not None
+
+    def summary(self):
+        matched = "; ".join(f"KTAS {level}: {criterion}" for level, criterion in self.criteria) or "no rule matched"
+        level = self.level if self.determined else "undetermined"
+        return f"Provisional KTAS {level}{' (URGENT)' if self.urgent else ''} - {matched}"
+
+
+def pre_triage(symptoms):
+    """Provisional KTAS level: the most acute level among all matching phrase and vital-sign rules."""
+    vitals = extract_vitals(symptoms)
+    criteria = [(level, criterion) for level, criterion, pattern in COMPILED_PHRASE_RULES if _affirmed(pattern, symptoms)]
+    criteria += [(level, criterion) for level, criterion, rule in VITAL_RULES if rule(vitals)]
+    criteria.sort(key=lambda item: item[0])
+    level = criteria[0][0] if criteria else UNDETERMINED_LEVEL
+    return PreTriageResult(level=level, criteria=criteria, vitals=vitals)
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+DEFAULT_CSV = "./RXNORM_cut.csv"
+DEFAULT_EMBEDDER = "BAAI/bge-small-en-v1.5"
+DEFAULT_INDEX_ROOT = "./.rxnorm_index"
+FORMAT_VERSION = 1
+
+# bge models expect this instruction in front of short retrieval queries.
+BGE_QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+# Rows scored per step, so int8/float16 vectors are never upcast all at once.
+SEARCH_CHUNK_ROWS = 65536
+
+
+#*-----------------Build-----------------*#
+
+def index_key(csv_path, embedder=DEFAULT_EMBEDDER, dtype="float16"):
+    """Content hash of the CSV plus everything else that changes the on-disk index."""
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"|{embedder}|{dtype}|v{FORMAT_VERSION}".encode())
+    return digest.hexdigest()[:24]
+
+
+def index_path(csv_path, embedder=DEFAULT_EMBEDDER, dtype="float16", index_root=DEFAULT_INDEX_ROOT):
+    return os.path.join(index_root, index_key(csv_path, embedder, dtype))
+
+
+def row_text(row):
+    return "; ".join(f"{column}: {value}" for column, value in row.items() if value)
+
+
+@functools.lru_cache(maxsize=None)
+def load_embedder(name=DEFAULT_EMBEDDER):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_service(name=DEFAULT_EMBEDDER):
+    """One micro-batching, caching query embedder per model for the whole process."""
+    from embedding_service import EmbeddingService
+
+    def encode(texts):
+        return load_embedder(name).encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+    return EmbeddingService(encode)
+
+
+def build_index(csv_path=DEFAULT_CSV, embedder=DEFAULT_EMBEDDER, dtype="float16",
+                index_root=DEFAULT_INDEX_ROOT, batch_size=256, force=False):
+    """
+    Embed every CSV row once and write the index under `index_root/<key>/`:
+
+        vectors.npy   (N, D) float16, or int8 with per-row scales.npy
+        offsets.npy   (N + 1,) uint64 byte offsets into rows.bin
+        rows.bin      UTF-8 JSON of each row, back to back
+        manifest.json
+
+    The key is a hash of the CSV bytes, the embedder and dtype, so a changed
+    CSV or model gets a fresh directory. Returns the index directory.
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"Unsupported index dtype: {dtype}")
+    key = index_key(csv_path, embedder, dtype)
+    out = os.path.join(index_root, key)
+    if os.path.exists(os.path.join(out, "manifest.json")) and not force:
+        return out
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    model = load_embedder(embedder)
+    vectors = model.encode(
+        [row_text(row) for row in rows],
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=True,
+    ).astype(np.float32)
+
+    # Write into a temporary directory and rename it into place, so concurrent
+    # readers never see a half-written index.
+    tmp = f"{out}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        np.save(os.path.join(tmp, "scales.npy"), scales.astype(np.float32))
+        np.save(os.path.join(tmp, "vectors.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+    else:
+        np.save(os.path.join(tmp, "vectors.npy"), vectors.astype(np.float16))
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.uint64)
+    with open(os.path.join(tmp, "rows.bin"), "wb") as f:
+        for i, row in enumerate(rows):
+            data = json.dumps(row, ensure_ascii=False).encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(tmp, "offsets.npy"), offsets)
+
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(dict(
+            version=FORMAT_VERSION,
+            csv=os.path.abspath(csv_path),
+            key=key,
+            embedder=embedder,
+            dtype=dtype,
+            rows=len(rows),
+            dim=int(vectors.shape[1]) if len(rows) else 0,
+        ), f, indent=2)
+
+    if os.path.exists(out):
+        shutil.rmtree(out)
+    os.replace(tmp, out)
+    return out
+
+
+#*-----------------Load / Search-----------------*#
+
+class RxNormIndex:
+    """
+    Read-only view of a prebuilt index. All arrays are memory-mapped, so worker
+    processes opening the same index share its pages through the OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.embedder_name = self.manifest["embedder"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        scales = os.path.join(path, "scales.npy")
+        self.scales = np.load(scales, mmap_mode="r") if os.path.exists(scales) else None
+        rows = os.path.join(path, "rows.bin")
+        self._rows = np.memmap(rows, dtype=np.uint8, mode="r") if os.path.getsize(rows) else np.zeros(0, np.uint8)
+
+    @classmethod
+    def open(cls, csv_path=DEFAULT_CSV, embedder=DEFAULT_EMBEDDER, dtype="float16",
+             index_root=DEFAULT_INDEX_ROOT, build=False):
+        """Open the index matching the CSV's current contents, optionally building it if missing."""
+        path = index_path(csv_path, embedder, dtype, index_root)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            if not build:
+                raise FileNotFoundError(
+                    f"No RxNorm index for {csv_path} ({embedder}, {dtype}); "
+                    f"run `python rxnorm_index.py build --csv {csv_path}`"
+                )
+            build_index(csv_path, embedder, dtype, index_root)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self._rows[start:end].tobytes().decode("utf-8"))
+
+    def embed_query(self, text):
+        if self.embedder_name.startswith("BAAI/bge"):
+            text = BGE_QUERY_INSTRUCTION + text
+        # concurrent queries from all requests are batched into one forward pass
+        return get_embedding_service(self.embedder_name).embed(text)
+
+    def search_vector(self, query_vector, k=5):
+        """Return [(row_index, score)] of the k rows with the highest cosine similarity."""
+        n = len(self)
+        if n == 0:
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_CHUNK_ROWS):
+            end = min(start + SEARCH_CHUNK_ROWS, n)
+            chunk = np.asarray(self.vectors[start:end], dtype=np.float32) @ query_vector
+            if self.scales is not None:
+                chunk *= self.scales[start:end]
+            scores[start:end] = chunk
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search(self, query, k=5):
+        """Return the k most similar CSV rows to `query` as dicts with an added `score`."""
+        return [dict(self.row(i), score=score) for i, score in self.search_vector(self.embed_query(query), k)]
+
+
+def format_rows(rows):
+    return "Relevant Content:\n" + "\n".join(row_text({k: v for k, v in row.items() if k != "score"}) for row in rows)
+
+
+#*-----------------CLI-----------------*#
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the memory-mapped RxNorm index.")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", help="query text (for `query`)")
+    parser.add_argument("--csv", default=DEFAULT_CSV)
+    parser.add_argument("--embedder", default=DEFAULT_EMBEDDER)
+    parser.add_argument("--dtype", default="float16", choices=["float16", "int8"])
+    parser.add_argument("--index-root", default=DEFAULT_INDEX_ROOT)
+    parser.add_argument("--force", action="store_true", help="rebuild even if a matching index exists")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        path = build_index(args.csv, args.embedder, args.dtype, args.index_root, force=args.force)
+        print(f"RxNorm index written to {path}")
+    else:
+        index = RxNormIndex.open(args.csv, args.embedder, args.dtype, args.index_root)
+        for row in index.search(args.text, args.k):
+            print(f"{row.pop('score'):.3f}  {row_text(row)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import bisect
+import csv
+import re
+from collections import defaultdict
+
+from rxnorm_index import row_text
+
+# Column names tried, in order, when the caller does not name them explicitly.
+RXCUI_COLUMNS = ("RXCUI", "rxcui")
+NAME_COLUMNS = ("STR", "str", "name", "NAME", "drug_name")
+
+NGRAM = 3
+MIN_FUZZY_SCORE = 0.5
+# A fuzzy match is only taken when it is this many edits from the query and no other
+# name is: look-alike/sound-alike drugs (hydroxyzine/hydralazine, prednisolone/prednisone)
+# share most of their n-grams, so anything looser must go to semantic search instead.
+MAX_FUZZY_EDITS = 1
+MAX_RESULTS = 5
+MIN_PREFIX_CHARS = 4  # shorter queries ("a", "asp") prefix-match arbitrary rows
+
+# Words naming a dose form or route. A prefix or fuzzy match must carry every strength and
+# dose-form word of the query; otherwise it is likely another product of the same drug and
+# the lookup misses, so the caller falls back to semantic search.
+DOSE_FORM_WORDS = frozenset(
+    "tablet tablets tab capsule capsules cap oral solution suspension syrup elixir injection injectable "
+    "intravenous intramuscular subcutaneous cream ointment gel lotion patch transdermal topical spray "
+    "inhaler inhalation nasal ophthalmic otic drops suppository rectal vaginal powder chewable extended "
+    "delayed release er xr sr dr".split()
+)
+
+_RXCUI_RE = re.compile(r"^\s*(?:rxcui\s*[:#]?\s*)?(\d+)\s*$", re.IGNORECASE)
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9.%/]+")
+_STRENGTH_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_name(name):
+    """Case-fold and collapse punctuation/whitespace, e.g. 'Aspirin  81 MG Oral-Tablet' -> 'aspirin 81 mg oral tablet'."""
+    return " ".join(_NON_ALNUM_RE.sub(" ", name.lower()).split())
+
+
+def _ngrams(text, n=NGRAM):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def _product_tokens(name):
+    """(strengths, dose-form words) of a normalized name, e.g. ({'500'}, {'oral', 'tablet'})."""
+    return set(_STRENGTH_RE.findall(name)), set(name.split()) & DOSE_FORM_WORDS
+
+
+def consistent(query, name):
+    """True if the normalized `name` has every strength and dose-form word of the normalized `query`."""
+    strengths, forms = _product_tokens(query)
+    name_strengths, name_forms = _product_tokens(name)
+    return strengths <= name_strengths and forms <= name_forms
+
+
+def _pick_column(fieldnames, candidates):
+    for column in candidates:
+        if column in fieldnames:
+            return column
+    raise ValueError(f"None of the columns {candidates} found in {fieldnames}")
+
+
+#*-----------------Lookup-----------------*#
+
+class RxNormLookup:
+    """
+    Deterministic in-memory RxNorm lookup: hash maps on RXCUI and normalized
+    name, a sorted name list for prefix matches and a character n-gram index for
+    fuzzy matches. Lookups take microseconds and never touch an embedder or LLM.
+    """
+
+    def __init__(self, rows, rxcui_column, name_column):
+        self.rows = rows
+        self.by_rxcui = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.ngram_index = defaultdict(set)
+
+        for i, row in enumerate(rows):
+            rxcui = (row.get(rxcui_column) or "").strip()
+            name = normalize_name(row.get(name_column) or "")
+            if rxcui:
+                self.by_rxcui[rxcui].append(i)
+            if name:
+                self.by_name[name].append(i)
+
+        self.names = sorted(self.by_name)
+        self._name_ngrams = []
+        for n, name in enumerate(self.names):
+            grams = _ngrams(name)
+            self._name_ngrams.append(len(grams))
+            for gram in grams:
+                self.ngram_index[gram].add(n)
+
+    @classmethod
+    def from_csv(cls, csv_path, rxcui_column=None, name_column=None):
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+            fieldnames = reader.fieldnames or []
+        return cls(
+            rows,
+            rxcui_column or _pick_column(fieldnames, RXCUI_COLUMNS),
+            name_column or _pick_column(fieldnames, NAME_COLUMNS),
+        )
+
+    def _rows(self, indices, match, limit):
+        return [dict(self.rows[i], match=match) for i in indices[:limit]]
+
+    def by_prefix(self, prefix, limit=MAX_RESULTS):
+        start = bisect.bisect_left(self.names, prefix)
+        indices = []
+        for name in self.names[start:]:
+            if not name.startswith(prefix) or len(indices) >= limit:
+                break
+            if consistent(prefix, name):
+                indices.extend(self.by_name[name])
+        return indices
+
+    def fuzzy(self, name, limit=MAX_RESULTS, min_score=MIN_FUZZY_SCORE):
+        """Return [(normalized_name, dice_score)] for names sharing enough character n-grams."""
+        grams = _ngrams(name)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for n in self.ngram_index.get(gram, ()):
+                overlap[n] += 1
+        scored = [
+            (self.names[n], 2.0 * shared / (len(grams) + self._name_ngrams[n]))
+            for n, shared in overlap.items()
+        ]
+        scored = [item for item in scored if item[1] >= min_score]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def lookup(self, query, limit=MAX_RESULTS):
+        """
+        Resolve an RXCUI or drug name to RxNorm rows, trying exact RXCUI, exact
+        name, name prefix and fuzzy name matches in that order. Each returned row
+        carries a `match` key naming the strategy that found it; [] is a miss.
+        Prefix and fuzzy matches must agree with the query's strengths and dose
+        forms (see consistent()), and prefixes need MIN_PREFIX_CHARS characters.
+        A fuzzy match must be the only name within MAX_FUZZY_EDITS edits, so a
+        drug missing from the table misses rather than resolving to a look-alike.
+        """
+        rxcui = _RXCUI_RE.match(query)
+        if rxcui:
+            return self._rows(self.by_rxcui.get(rxcui.group(1), []), "rxcui", limit)
+
+        name = normalize_name(query)
+        if not name:
+            return []
+        if name in self.by_name:
+            return self._rows(self.by_name[name], "exact", limit)
+
+        prefix = self.by_prefix(name, limit) if len(name) >= MIN_PREFIX_CHARS else []
+        if prefix:
+            return self._rows(prefix, "prefix", limit)
+
+        near = [
+            fuzzy_name for fuzzy_name, _ in self.fuzzy(name, limit)
+            if edit_distance(name, fuzzy_name) <= MAX_FUZZY_EDITS and consistent(name, fuzzy_name)
+        ]
+        if len(near) != 1:
+            return []
+        return self._rows(self.by_name[near[0]], "fuzzy", limit)
+
+
+def format_matches(rows):
+    return "RxNorm Matches:\n" + "\n".join(row_text(row) for row in rows)
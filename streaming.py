@@ -0,0 +1,98 @@
+import asyncio
+import queue
+import re
+import threading
+from typing import NamedTuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+_KTAS_RE = re.compile(r"KTAS\s+CLASSIFICATION\s*:?\s*\**\s*(?:level\s*)?([1-5])", re.IGNORECASE)
+
+
+class StreamEvent(NamedTuple):
+    # "pre_triage": data is the provisional pre_triage.PreTriageResult, emitted before the crew starts
+    # "task":       a task finished, data is its full output
+    # "token":      data is an LLM token of that task
+    kind: str
+    task: str
+    data: object
+
+
+def ktas_level(text):
+    """The level from a triage report's `KTAS CLASSIFICATION:` line, or None."""
+    match = _KTAS_RE.search(text or "")
+    return int(match.group(1)) if match else None
+
+
+#*-----------------Token streaming-----------------*#
+
+class TokenForwarder(BaseCallbackHandler):
+    """Forwards every streamed LLM token to `emit` as a StreamEvent for `task`."""
+
+    def __init__(self, task, emit):
+        self.task = task
+        self.emit = emit
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.emit(StreamEvent("token", self.task, token))
+
+
+def streaming_llm(llm, task, emit):
+    """
+    Copy of `llm` (sharing its client) that streams tokens for `task` to `emit`.
+    Models without a `streaming` switch still work; they just emit no tokens.
+    """
+    update = dict(callbacks=list(llm.callbacks or []) + [TokenForwarder(task, emit)])
+    if hasattr(llm, "streaming"):
+        update["streaming"] = True
+    return llm.copy(update=update)
+
+
+#*-----------------Event iteration-----------------*#
+
+def stream_events(run):
+    """
+    Call `run(emit)` on a background thread and yield every event it emits, as
+    soon as it is emitted. Exceptions raised by `run` are re-raised at the end.
+    """
+    events = queue.Queue()
+    done = object()
+    error = []
+
+    def target():
+        try:
+            run(events.put)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            events.put(done)
+
+    thread = threading.Thread(target=target, name="er-stream", daemon=True)
+    thread.start()
+    while True:
+        event = events.get()
+        if event is done:
+            break
+        yield event
+    thread.join()
+    if error:
+        raise error[0]
+
+
+async def astream_events(run):
+    """Async-generator version of stream_events; `run` executes in the default executor."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    done = object()
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    future = loop.run_in_executor(None, run, emit)
+    future.add_done_callback(lambda _: events.put_nowait(done))
+    while True:
+        event = await events.get()
+        if event is done:
+            break
+        yield event
+    await future
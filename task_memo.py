@@ -0,0 +1,106 @@
+import hashlib
+import json
+import sqlite3
+import string
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import astuple
+
+# Task-level memoization. A task's output is stored under a hash of its template, its
+# rendered description and expected output, and the (compacted) upstream context it was
+# given, so re-running a patient whose symptoms changed only recomputes what can differ.
+
+DEFAULT_MAXSIZE = 1024
+
+
+def normalize_input(text):
+    """Whitespace-insensitive form of a symptoms text, so re-submitting it reformatted is a no-op."""
+    return " ".join((text or "").split())
+
+
+def task_key(template, description, expected_output, context=None, salt=""):
+    """Memo key of one task execution; `salt` identifies the models and their settings."""
+    payload = json.dumps(
+        [repr(astuple(template)), description, expected_output, context or "", salt],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def template_inputs(template):
+    """Names of the {placeholders} a task template renders."""
+    names = set()
+    for text in (template.description, template.expected_output):
+        try:
+            names.update(field for _, field, _, _ in string.Formatter().parse(text) if field)
+        except ValueError:
+            return None  # not a format string we understand: treat it as using every input
+    return names
+
+
+def affected_tasks(templates, old_inputs, new_inputs):
+    """
+    Names of the tasks in `templates` (in dependency order) that have to run again when
+    the inputs change from `old_inputs` to `new_inputs`: tasks rendering a changed
+    input, and every task downstream of one.
+    """
+    changed = {k for k in set(old_inputs) | set(new_inputs) if old_inputs.get(k) != new_inputs.get(k)}
+    affected = []
+    for name, template in templates.items():
+        used = template_inputs(template)
+        if (used is None and changed) or (used and used & changed) or any(u in affected for u in template.context):
+            affected.append(name)
+    return affected
+
+
+class TaskMemo:
+    """
+    In-memory LRU of task outputs, optionally backed by a SQLite file so memoized
+    results survive restarts and are shared between worker processes.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS task_memo (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                return value
+        if self.path:
+            row = self._connect().execute("SELECT value FROM task_memo WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.path:
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO task_memo VALUES (?, ?, ?)", (key, value, time.time()))
@@ -0,0 +1,152 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Same divider crewAI uses when it aggregates upstream task outputs into context.
+CONTEXT_DIVIDER = "\n\n----------\n\n"
+
+
+#*-----------------Graph-----------------*#
+
+class TaskGraph:
+    """Dependency graph of crewAI tasks, built from each Task's `context` list."""
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        index = {id(task): i for i, task in enumerate(self.tasks)}
+
+        self.dependencies = []
+        for task in self.tasks:
+            deps = []
+            for upstream in task.context or []:
+                if id(upstream) not in index:
+                    raise ValueError(
+                        f"Task '{_task_name(task)}' depends on a task that is not scheduled: "
+                        f"'{_task_name(upstream)}'"
+                    )
+                deps.append(index[id(upstream)])
+            self.dependencies.append(deps)
+
+        self.dependents = [[] for _ in self.tasks]
+        for i, deps in enumerate(self.dependencies):
+            for d in deps:
+                self.dependents[d].append(i)
+
+        self.levels = self._topological_levels()
+
+    def _topological_levels(self):
+        remaining = [len(deps) for deps in self.dependencies]
+        level = [i for i, n in enumerate(remaining) if n == 0]
+        levels = []
+        seen = 0
+        while level:
+            levels.append(level)
+            seen += len(level)
+            next_level = []
+            for i in level:
+                for j in self.dependents[i]:
+                    remaining[j] -= 1
+                    if remaining[j] == 0:
+                        next_level.append(j)
+            level = next_level
+        if seen != len(self.tasks):
+            cyclic = [_task_name(self.tasks[i]) for i, n in enumerate(remaining) if n > 0]
+            raise ValueError(f"Task context dependencies form a cycle: {cyclic}")
+        return levels
+
+    def critical_path_length(self):
+        return len(self.levels)
+
+
+#*-----------------Scheduler-----------------*#
+
+class TaskScheduler:
+    """
+    Runs crewAI tasks as a DAG: every task starts as soon as all tasks in its
+    `context` have finished, so independent tasks run concurrently and the
+    end-to-end latency is the critical path instead of the sum of all tasks.
+    """
+
+    def __init__(self, tasks, max_workers=None, context_builder=None, executor=None):
+        self.graph = TaskGraph(tasks)
+        self.tasks = self.graph.tasks
+        self.max_workers = max_workers or max(len(level) for level in self.graph.levels)
+        # context_builder(task, [(upstream_task, output)]) -> context string
+        self.context_builder = context_builder or join_context
+        # executor(task, context) -> raw output
+        self.executor = executor or execute_task
+
+    def run(self, inputs=None, on_task_complete=None):
+        """
+        Execute all tasks and return their raw outputs, in the order the tasks were
+        given. `on_task_complete(task, output)` is called as each task finishes.
+        """
+        if inputs is not None:
+            self._interpolate_inputs(inputs)
+
+        outputs = [None] * len(self.tasks)
+        remaining = [len(deps) for deps in self.graph.dependencies]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crew-task") as pool:
+            running = {}
+
+            def submit(i):
+                # run each task in a copy of the caller's context so context variables
+                # (e.g. the active request trace) are visible inside the worker thread
+                context = contextvars.copy_context()
+                running[pool.submit(context.run, self._execute, i, outputs)] = i
+
+            for i in self.graph.levels[0]:
+                submit(i)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    try:
+                        outputs[i] = future.result()
+                    except BaseException:
+                        for pending in running:
+                            pending.cancel()
+                        raise
+                    if on_task_complete is not None:
+                        on_task_complete(self.tasks[i], outputs[i])
+                    for j in self.graph.dependents[i]:
+                        remaining[j] -= 1
+                        if remaining[j] == 0:
+                            submit(j)
+
+        return outputs
+
+    def _interpolate_inputs(self, inputs):
+        agents = []
+        for task in self.tasks:
+            task.interpolate_inputs(inputs)
+            if task.agent is not None and all(task.agent is not a for a in agents):
+                agents.append(task.agent)
+        for agent in agents:
+            if hasattr(agent, "interpolate_inputs"):
+                agent.interpolate_inputs(inputs)
+
+    def _execute(self, i, outputs):
+        task = self.tasks[i]
+        upstream = [(self.tasks[d], outputs[d]) for d in self.graph.dependencies[i]]
+        context = self.context_builder(task, upstream) if upstream else None
+        return self.executor(task, context or None)
+
+
+def join_context(task, upstream):
+    """crewAI's own context: the full upstream outputs, joined by CONTEXT_DIVIDER."""
+    return CONTEXT_DIVIDER.join(output for _, output in upstream)
+
+
+def execute_task(task, context=None, agent=None):
+    """Run a single crewAI task on its own agent (or `agent`) and return the raw output text."""
+    # crewAI >= 0.36 exposes execute_sync() returning a TaskOutput; older versions return a str.
+    execute = getattr(task, "execute_sync", None) or task.execute
+    output = execute(agent=agent or task.agent, context=context, tools=task.tools)
+    return getattr(output, "raw", output)
+
+
+def _task_name(task):
+    return getattr(task, "name", None) or (task.description or "").strip().split("\n")[0][:60]
+
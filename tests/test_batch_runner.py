@@ -0,0 +1,88 @@
+import json
+import threading
+
+import pytest
+
+import batch_runner
+from batch_runner import BatchRunner, Checkpoint
+from er_result import ERResult
+
+
+class FakeQA:
+    """Stands in for EmergencyRoomQA: answers from a script of outcomes per symptoms text."""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_er_result(self, symptoms):
+        with self._lock:
+            self.calls.append(symptoms)
+            outcome = self.outcomes.get(symptoms, [])
+            outcome = outcome.pop(0) if outcome else "ok"
+        if outcome == "error":
+            raise RuntimeError(f"failed on {symptoms}")
+        degraded = ["triage_assessment: time budget exhausted"] if outcome == "degraded" else []
+        return ERResult(request_id=symptoms, symptoms=symptoms, output=f"report for {symptoms}", degraded=degraded)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(batch_runner, "backoff_delay", lambda attempt: 0)
+
+
+def run(path, qa, items, **kwargs):
+    return BatchRunner(str(path), qa_factory=lambda: qa, concurrency=2, **kwargs).run(items)
+
+
+ITEMS = [(1, "a"), (2, "b"), (3, "c")]
+
+
+def test_checkpoint_ignores_a_torn_last_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text(json.dumps(dict(key=1, status="ok")) + "\n" + '{"key": 2, "sta')
+    assert Checkpoint(str(path)).load() == {1: dict(key=1, status="ok")}
+
+
+def test_resume_skips_finished_keys(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text(json.dumps(dict(key=1, status="ok", output="earlier")) + "\n" + '{"key": 2, "sta')
+    qa = FakeQA()
+    records = run(path, qa, ITEMS)
+    assert sorted(qa.calls) == ["b", "c"]
+    assert records[1]["output"] == "earlier"
+    assert records[2]["output"] == "report for b"
+    assert sorted(Checkpoint(str(path)).load()) == [1, 2, 3]
+
+
+def test_retries_then_records_the_error(tmp_path):
+    qa = FakeQA(dict(a=["error", "ok"], b=["error"] * 3))
+    records = run(tmp_path / "checkpoint.jsonl", qa, ITEMS[:2], max_retries=3)
+    assert (records[1]["status"], records[1]["attempts"]) == ("ok", 2)
+    assert (records[2]["status"], records[2]["attempts"]) == ("error", 3)
+    assert "failed on b" in records[2]["output"]
+
+
+def test_degraded_is_retried_and_kept_on_the_last_attempt(tmp_path):
+    qa = FakeQA(dict(a=["degraded", "ok"], b=["degraded"] * 2))
+    records = run(tmp_path / "checkpoint.jsonl", qa, ITEMS[:2], max_retries=2)
+    assert (records[1]["status"], records[1]["attempts"]) == ("ok", 2)
+    assert (records[2]["status"], records[2]["attempts"]) == ("degraded", 2)
+    assert records[2]["result"]["degraded"] == ["triage_assessment: time budget exhausted"]
+
+
+@pytest.mark.parametrize("retry_errors, rerun", [(False, []), (True, ["b", "c"])])
+def test_retry_errors_reruns_error_and_degraded_rows(tmp_path, retry_errors, rerun):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text("".join(
+        json.dumps(record) + "\n"
+        for record in (dict(key=1, status="ok"), dict(key=2, status="error"), dict(key=3, status="degraded"))
+    ))
+    qa = FakeQA()
+    records = run(path, qa, ITEMS, retry_errors=retry_errors)
+    assert sorted(qa.calls) == rerun
+    if retry_errors:
+        assert {key: record["status"] for key, record in records.items()} == {1: "ok", 2: "ok", 3: "ok"}
+        # the newer record wins when the checkpoint is loaded again
+        assert Checkpoint(str(path)).load()[3]["status"] == "ok"
@@ -0,0 +1,83 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import benchmark
+from benchmark import compare, percentile, scenario_key, stage_latencies
+
+# Baseline of the smoke scenario below; record it on the reference machine with:
+#   python benchmark.py --patients 2 --concurrency 1,2 --latency-scale 0 \
+#       --baseline tests/benchmark_baseline.json --save-baseline
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+SMOKE_ARGS = ["--patients", "2", "--concurrency", "1,2", "--latency-scale", "0", "--baseline", BASELINE]
+
+
+@pytest.mark.parametrize("values, q, expected", [
+    ([], 50, None),
+    ([3.0], 99, 3.0),
+    ([5, 1, 4, 2, 3], 50, 3),
+    ([5, 1, 4, 2, 3], 95, 5),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 99, 99),
+])
+def test_percentile(values, q, expected):
+    assert percentile(values, q) == expected
+
+
+def result(throughput=10.0, p95=1.0, overhead=0.05, rss=200.0):
+    return dict(throughput=throughput, request=dict(p95=p95), stages=dict(overhead=dict(p95=overhead)), peak_rss_mb=rss)
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    key = scenario_key(2, 1)
+    baseline = dict(scenarios={key: result()})
+    assert compare({key: result(throughput=9.0, p95=1.1)}, baseline, tolerance=0.2) == []
+    regressions = compare({key: result(throughput=7.0, p95=1.5)}, baseline, tolerance=0.2)
+    assert regressions == [
+        f"{key} throughput: 10 -> 7 (+30% worse)",
+        f"{key} request.p95: 1 -> 1.5 (+50% worse)",
+    ]
+
+
+def test_compare_ignores_small_absolute_changes_and_unknown_scenarios():
+    key = scenario_key(2, 1)
+    baseline = dict(scenarios={key: result(overhead=0.001, rss=20.0)})
+    assert compare({key: result(overhead=0.004, rss=30.0)}, baseline) == []
+    assert compare({scenario_key(8, 4): result(throughput=1.0)}, baseline) == []
+
+
+def test_compare_skips_missing_metrics():
+    key = scenario_key(2, 1)
+    baseline = dict(scenarios={key: dict(throughput=10.0, peak_rss_mb=None)})
+    assert compare({key: result(rss=900.0)}, baseline) == []
+
+
+def span(kind, task, duration, name=None):
+    return dict(kind=kind, task=task, duration=duration, name=name)
+
+
+def test_stage_latencies_split_overhead():
+    trace = SimpleNamespace(spans=[
+        span("task", "medical_diagnosis", 1.0),
+        span("llm", "medical_diagnosis", 0.6),
+        span("tool", "medical_diagnosis", 0.3, name="search"),
+        span("task", "triage_assessment", 0.5),
+    ])
+    stages = stage_latencies([trace])
+    assert stages["task:medical_diagnosis"] == [1.0]
+    assert stages["llm"] == [0.6]
+    assert stages["tool:search"] == [0.3]
+    assert stages["overhead"] == pytest.approx([0.1, 0.5])
+
+
+def test_check_without_baseline_fails(tmp_path):
+    assert benchmark.main(["--check", "--baseline", str(tmp_path / "missing.json")]) == 2
+
+
+def test_small_scenario_against_baseline():
+    pytest.importorskip("crewai")
+    if not os.path.exists(BASELINE):
+        pytest.skip(f"no baseline at {BASELINE}; record one with: python benchmark.py "
+                    + " ".join(SMOKE_ARGS) + " --save-baseline")
+    assert benchmark.main(SMOKE_ARGS + ["--check"]) == 0
@@ -0,0 +1,64 @@
+from context_compaction import compact_context, compact_medications, compact_report
+
+ACS_REPORT = """
+PRIMARY DIAGNOSIS: NSTEMI
+
+Supporting Evidence: Crushing chest pain radiating to the left arm, ST depression in V4-V6.
+
+Treatment Plan:
+1. Medications:
+   a. Aspirin 325 mg PO once, chewed, then 81 mg PO daily - antiplatelet therapy (RxNorm verified)
+   b. Ticagrelor 180 mg PO loading dose, then 90 mg PO twice daily - P2Y12 inhibition (RxNorm verified)
+   c. Heparin 60 units/kg IV bolus (max 4000 units), then 12 units/kg/h infusion - anticoagulation (RxNorm verified)
+   d. Nitroglycerin 0.4 mg SL every 5 minutes up to 3 doses, then IV infusion 10 mcg/min titrated to pain and blood pressure - anti-ischemic (RxNorm verified)
+   e. Metoprolol tartrate 25 mg PO every 6 hours if no signs of heart failure or shock - rate control (RxNorm verified)
+   f. Atorvastatin 80 mg PO daily - high-intensity statin (RxNorm verified)
+   g. Morphine 2-4 mg IV every 5-15 minutes as needed for refractory pain - analgesia (RxNorm verified)
+2. Interventions/Procedures: Continuous cardiac monitoring, serial ECGs every 15-30 minutes, cardiology consult for early invasive strategy within 24 hours.
+3. Fluid Management: Saline lock; avoid fluid overload.
+4. Pain Management: Nitrates first, morphine only for refractory pain.
+
+Diagnostic Tests:
+1. Serial troponin: rule in/out myocardial injury
+"""
+
+MEDICATIONS_REPORT = """
+MEDICATION SAFETY REPORT
+
+Prescribed Medications Analysis:
+""" + "".join(
+    f"""
+{i}. Drug{i} (RxNorm verified)
+   - Dose/Route/Frequency: {i} mg PO daily
+   - Interactions: none known with drug{i + 1}
+   - Contraindications: allergy to drug{i}
+""" for i in range(1, 9)
+) + """
+Recommendations: Continue all.
+"""
+
+
+def test_treatment_plan_keeps_every_drug_and_intervention():
+    plan = compact_report("medical_diagnosis", ACS_REPORT, ("treatment_plan",))
+    for drug in ("Aspirin", "Ticagrelor", "Heparin", "Nitroglycerin", "Metoprolol", "Atorvastatin", "Morphine"):
+        assert drug in plan
+    assert "Continuous cardiac monitoring" in plan
+    assert "Saline lock" in plan
+    assert "Nitrates first" in plan
+    assert "RxNorm verified" not in plan
+    assert "Serial troponin" not in plan
+
+
+def test_medications_keep_every_drug():
+    medications = compact_report("medication_review", MEDICATIONS_REPORT, ("medications",))
+    assert medications.count("\n- Drug") == 8
+    assert "- Drug8: dose 8 mg PO daily; interactions none known with drug9; contraindications allergy to drug8" in medications
+
+
+def test_medications_without_numbered_entries_pass_whole():
+    assert compact_medications("Aspirin 81 mg daily.\nNo interactions.") == "Aspirin 81 mg daily.\nNo interactions."
+
+
+def test_context_falls_back_to_raw_text():
+    context = compact_context("er_management_decision", [("medical_diagnosis", "free text, no headers")])
+    assert context == "[medical_diagnosis]\nfree text, no headers"
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from deadlines import BudgetExceeded, best_effort, current_budget, request_deadline, run_within_budget, task_budget
+from pre_triage import pre_triage
+
+
+def test_task_runs_past_its_budget():
+    with task_budget("triage_assessment", 0.1) as budget:
+        started = time.monotonic()
+        with pytest.raises(BudgetExceeded, match="time budget exhausted"):
+            run_within_budget(budget, time.sleep, 1.0)
+        assert time.monotonic() - started < 0.5
+        assert budget.stop_reason == "time budget exhausted"
+
+
+def test_task_sees_its_budget():
+    with request_deadline(10), task_budget("medical_diagnosis") as budget:
+        assert budget.deadline is not None
+        assert run_within_budget(budget, lambda: current_budget().task) == "medical_diagnosis"
+
+
+def test_unbounded_task_runs_inline():
+    with task_budget("medical_diagnosis") as budget:
+        assert budget.deadline is None
+        assert run_within_budget(budget, lambda: current_budget() is budget)
+
+
+def test_best_effort_triage():
+    with task_budget("triage_assessment") as budget:
+        budget.stop_reason = "time budget exhausted"
+        assert best_effort("triage_assessment", budget, pre_triage("crushing chest pain")).startswith(
+            "KTAS CLASSIFICATION: 2"
+        )
+        assert best_effort("triage_assessment", budget, pre_triage("feels unwell")).startswith(
+            "KTAS CLASSIFICATION: Undetermined"
+        )
+        budget.complete_output = "KTAS CLASSIFICATION: 3"
+        assert best_effort("triage_assessment", budget) == "KTAS CLASSIFICATION: 3"
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from er_result import ERResult, JSONLResultWriter, parse_disposition, parse_medications
+
+
+@pytest.mark.parametrize("text, disposition", [
+    ("Admit to the cardiac care unit", "Admit"),
+    ("**Admission** to ICU for close monitoring", "Admit"),
+    ("Discharge home with follow-up in 48 hours", "Discharge"),
+    ("Transfer to a PCI-capable center", "Transfer"),
+    ("Continue ER care pending troponin results", "Continue ER care"),
+    ("Not suitable for discharge - admit to ICU", "Admit"),
+    ("Discharge is not appropriate; admit to ICU", "Admit"),
+    ("Discharge would be unsafe, admit for observation", "Admit"),
+    ("Admit rather than discharge", "Admit"),
+    ("Transfer if not improving, otherwise admit", "Transfer"),
+    ("Admit to ICU\nDischarge is not an option", "Admit"),
+    ("Observation in the ED", "Observation in the ED"),
+    ("", None),
+    (None, None),
+])
+def test_parse_disposition(text, disposition):
+    assert parse_disposition(text) == disposition
+
+
+MEDICATION_REVIEW = """
+MEDICATION SAFETY REPORT
+
+Prescribed Medications Analysis:
+1. **Aspirin** (RxNorm verified): 325 mg PO once
+2. Ticagrelor: 180 mg PO loading dose
+3. aspirin: duplicate entry
+
+Recommendations: none
+"""
+
+DIAGNOSIS = """
+PRIMARY DIAGNOSIS: NSTEMI
+
+Treatment Plan:
+1. Medications:
+   a. Heparin, 60 units/kg IV bolus - anticoagulation
+   b. Nitroglycerin (0.4 mg SL) - anti-ischemic
+2. Interventions/Procedures: cardiac monitoring
+"""
+
+
+def test_parse_medications_from_review():
+    assert parse_medications(MEDICATION_REVIEW, DIAGNOSIS) == ["Aspirin", "Ticagrelor"]
+
+
+def test_parse_medications_falls_back_to_treatment_plan():
+    assert parse_medications("no report", DIAGNOSIS) == ["Heparin", "Nitroglycerin"]
+    assert parse_medications(None, None) == []
+
+
+def test_result_is_its_output_and_writes_flat_records(tmp_path):
+    result = ERResult(
+        request_id="r1",
+        symptoms="chest pain",
+        output="final report",
+        reports=dict(medical_diagnosis=DIAGNOSIS, er_management_decision="final report"),
+        timings=dict(medical_diagnosis=1.5),
+        medications=["Heparin"],
+    )
+    assert str(result) == "final report"
+    path = tmp_path / "results.jsonl"
+    with JSONLResultWriter(str(path)) as writer:
+        writer.write(result)
+    record = json.loads(path.read_text())
+    assert record["output"] == "final report"
+    assert record["medical_diagnosis_report"] == DIAGNOSIS
+    assert record["medical_diagnosis_seconds"] == 1.5
+    assert "er_management_decision_report" not in record
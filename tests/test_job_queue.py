@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from batch_runner import GroqRateLimiter
+from job_queue import JobQueue, worker_owner
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=60, max_attempts=2)
+    queue.enqueue_many([(1, "chest pain"), (2, "sore throat")])
+    return queue
+
+
+def status(queue):
+    return {key: (status, attempts, error) for key, status, attempts, _, error in queue.results()}
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue_many([(1, "changed"), (3, "fever")]) == ["1", "3"]
+    assert queue.counts()["queued"] == 3
+
+
+def test_lease_hands_out_each_job_once(queue):
+    first, second = queue.lease("a"), queue.lease("b")
+    assert (first.key, second.key) == ("1", "2")
+    assert first.attempts == 1
+    assert queue.lease("c") is None
+    assert queue.counts() == dict(queued=0, leased=2, done=0, failed=0)
+
+
+def test_complete_requires_the_lease(queue):
+    job = queue.lease("a")
+    assert not queue.complete(job.id, "b", {"output": "x"})
+    assert queue.complete(job.id, "a", {"output": "x"})
+    assert list(queue.results())[0] == ("1", "done", 1, {"output": "x"}, None)
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.lease_seconds = 0.01
+    job = queue.lease("a")
+    queue.lease("a")
+    time.sleep(0.02)
+    again = queue.lease("b")
+    assert (again.key, again.attempts) == (job.key, 2)
+    assert not queue.renew(job.id, "a")
+    assert not queue.complete(job.id, "a", {})
+    assert queue.renew(job.id, "b")
+
+
+def test_expired_lease_on_last_attempt_fails(queue):
+    queue.lease_seconds = 0.01
+    queue.lease("a"), queue.lease("a")
+    time.sleep(0.02)
+    queue.lease("b"), queue.lease("b")
+    time.sleep(0.02)
+    assert queue.lease("c") is None
+    assert status(queue) == {"1": ("failed", 2, "lease expired"), "2": ("failed", 2, "lease expired")}
+
+
+def test_fail_retries_until_max_attempts(queue):
+    job = queue.lease("a")
+    assert queue.fail(job.id, "a", "boom")
+    assert status(queue)["1"] == ("queued", 1, "boom")
+    job = queue.lease("a")
+    assert queue.fail(job.id, "a", "boom again")
+    assert status(queue)["1"] == ("failed", 2, "boom again")
+    assert queue.requeue_failed() == 1
+    assert status(queue)["1"][:2] == ("queued", 0)
+
+
+def test_release_only_matches_the_dead_process(queue):
+    dead, other = worker_owner(0, 111), worker_owner(0, 1112)
+    queue.lease(dead + "0")
+    queue.lease(other + "0")
+    assert queue.release(dead) == 1
+    assert status(queue) == {"1": ("queued", 1, "worker died"), "2": ("leased", 1, None)}
+
+
+def test_release_of_a_stopped_worker_gives_the_attempt_back(queue):
+    owner = worker_owner(0, 111)
+    queue.lease(owner + "0")
+    assert queue.release(owner, error="worker stopped", count_attempt=False) == 1
+    assert status(queue)["1"] == ("queued", 0, "worker stopped")
+
+
+def test_release_on_last_attempt_fails(queue):
+    owner = worker_owner(0, 111)
+    job = queue.lease(owner + "0")
+    queue.fail(job.id, owner + "0", "boom")
+    queue.lease(owner + "0")
+    assert queue.release(owner) == 1
+    assert status(queue)["1"] == ("failed", 2, "worker died")
+
+
+def test_rate_limiter_with_one_quota():
+    limiter = GroqRateLimiter(60, None)
+    limiter.tokens.acquire(10 ** 9)
+    limiter.requests.acquire(1)
+    limiter = GroqRateLimiter(None, 6000)
+    limiter.requests.acquire(10 ** 9)
@@ -0,0 +1,29 @@
+import pytest
+
+from model_routing import LARGE, SMALL, ModelRouter
+from pre_triage import pre_triage
+
+
+@pytest.mark.parametrize("symptoms, tier", [
+    (None, LARGE),  # pre-triage disabled
+    ("Feels unwell", LARGE),  # no rule matched
+    ("crushing chest pain", LARGE),
+    ("respiratory distress", LARGE),
+    ("runny nose and sore throat", SMALL),
+])
+def test_initial_tier(symptoms, tier):
+    provisional = pre_triage(symptoms) if symptoms is not None else None
+    router = ModelRouter()
+    assert router.initial_tier("triage_assessment", provisional) == tier
+    assert router.initial_tier("medical_diagnosis", provisional) == LARGE
+
+
+@pytest.mark.parametrize("output, reason", [
+    ("", "empty output"),
+    ("KTAS CLASSIFICATION: Level 2\nDetailed Justification: chest pain", "KTAS 2"),
+    ("KTAS CLASSIFICATION: Level 5\nDetailed Justification: cold symptoms", None),
+    ("KTAS CLASSIFICATION: Level 5\nDetailed Justification: I am not sure", "low confidence"),
+    ("Level 5", "parse failure: missing ktas_level, justification"),
+])
+def test_escalation_reason(output, reason):
+    assert ModelRouter().escalation_reason("triage_assessment", output) == reason
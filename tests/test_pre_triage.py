@@ -0,0 +1,60 @@
+import pytest
+
+from pre_triage import extract_vitals, pre_triage
+
+
+@pytest.mark.parametrize("text, vitals", [
+    ("HR 104, RR 24", dict(heart_rate=104.0, respiratory_rate=24.0)),
+    ("HR: 160", dict(heart_rate=160.0)),
+    ("HR 30 bpm", dict(heart_rate=30.0)),
+    ("started 2 hr 30 min ago", {}),
+    ("heart rate 88", dict(heart_rate=88.0)),
+    ("Temp 101.2 F", dict(temperature=38.4)),
+    ("temperature 39.2 °C", dict(temperature=39.2)),
+    ("Temp 38.5", dict(temperature=38.5)),
+    ("SpO2 93% on room air", dict(spo2=93.0)),
+])
+def test_extract_vitals(text, vitals):
+    assert extract_vitals(text) == vitals
+
+
+@pytest.mark.parametrize("text", [
+    "started 2 hr 30 min ago",
+    "He was not in shock",
+    "history of stroke",
+    "PMH: HTN, DM, CAD, prior stroke",
+    "treated for septic shock in 2019",
+    "stroke in 2015",
+    "Denies chest pain",
+    "Patient denies fever, chills, or chest pain",
+    "No fever, chest pain or shortness of breath",
+    "Denies nausea, vomiting, diarrhea, chest pain, and shortness of breath",
+    "Mother had a heart attack",
+    "Family history of stroke, diabetes and heart attack",
+    "Father's stroke at 60",
+])
+def test_no_rule_matches(text):
+    result = pre_triage(text)
+    assert result.criteria == []
+    assert result.level is None
+    assert not result.determined
+    assert "undetermined" in result.summary()
+
+
+@pytest.mark.parametrize("text, level", [
+    ("Temp 101.2 F", 4),
+    ("respiratory distress", 3),
+    ("acute stroke with facial droop", 2),
+    ("history of hypertension, presents with septic shock", 1),
+    ("h/o stroke. Now with chest pain", 2),
+    ("Denies fever, chills, but reports chest pain", 2),
+    ("No trauma, crushing chest pain radiating to the arm and sweating", 2),
+    ("Mother had a heart attack. Now with chest pain", 2),
+    ("Mother brought him in with chest pain", 2),
+    ("Family history of MI, presents with chest pain", 2),
+    ("HR 30 bpm", 1),
+    ("42-year-old woman with crushing chest pain radiating to the left arm. BP 150/90, HR 110.", 2),
+    ("30-year-old man with a 3 cm laceration on the left forearm. Vital signs normal.", 5),
+])
+def test_level(text, level):
+    assert pre_triage(text).level == level
@@ -0,0 +1,65 @@
+import pytest
+
+from rxnorm_lookup import RxNormLookup, edit_distance
+
+NAMES = [
+    "hydralazine",
+    "hydromorphone",
+    "chlorpropamide",
+    "carbamazepine",
+    "prednisone",
+    "aspirin",
+    "aspirin 81 mg oral tablet",
+    "aspirin 325 mg oral tablet",
+    "metformin 500 mg oral tablet",
+]
+
+
+@pytest.fixture
+def lookup():
+    rows = [dict(RXCUI=str(1000 + i), STR=name) for i, name in enumerate(NAMES)]
+    return RxNormLookup(rows, "RXCUI", "STR")
+
+
+def names(rows):
+    return [row["STR"] for row in rows]
+
+
+@pytest.mark.parametrize("missing", [
+    "hydroxyzine",
+    "hydrocodone",
+    "chlorpromazine",
+    "oxcarbazepine",
+    "prednisolone",
+])
+def test_look_alike_drug_misses(lookup, missing):
+    assert lookup.lookup(missing) == []
+
+
+@pytest.mark.parametrize("query, match, expected", [
+    ("1005", "rxcui", ["aspirin"]),
+    ("Aspirin 81 MG Oral-Tablet", "exact", ["aspirin 81 mg oral tablet"]),
+    ("metformin 500", "prefix", ["metformin 500 mg oral tablet"]),
+    ("hydralazin", "prefix", ["hydralazine"]),
+    ("predisone", "fuzzy", ["prednisone"]),
+    ("asprin 81 mg oral tablet", "fuzzy", ["aspirin 81 mg oral tablet"]),
+])
+def test_lookup(lookup, query, match, expected):
+    rows = lookup.lookup(query)
+    assert names(rows) == expected
+    assert {row["match"] for row in rows} == {match}
+
+
+def test_short_prefix_misses(lookup):
+    assert lookup.lookup("asp") == []
+
+
+def test_other_strength_misses(lookup):
+    assert lookup.lookup("metformin 850 mg oral tablet") == []
+    assert lookup.lookup("aspirin 500 mg") == []
+
+
+def test_edit_distance():
+    assert edit_distance("prednisone", "prednisolone") == 2
+    assert edit_distance("asprin", "aspirin") == 1
+    assert edit_distance("", "abc") == 3
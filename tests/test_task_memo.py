@@ -0,0 +1,21 @@
+from crewai_240721 import TASK_TEMPLATES
+from task_memo import affected_tasks, normalize_input, template_inputs
+
+CASE = "BP 85/50 after taking sildenafil, HR 48. History of angina on isosorbide mononitrate."
+
+
+def test_every_task_renders_the_whole_symptoms_text():
+    for name, template in TASK_TEMPLATES.items():
+        assert "input" in template_inputs(template), name
+
+
+def test_changed_symptoms_rerun_every_task():
+    old = {"input": normalize_input(CASE)}
+    new = {"input": normalize_input(CASE.replace("HR 48", "HR 44"))}
+    assert affected_tasks(TASK_TEMPLATES, old, new) == list(TASK_TEMPLATES)
+
+
+def test_reformatted_symptoms_rerun_nothing():
+    old = {"input": normalize_input(CASE)}
+    new = {"input": normalize_input(CASE.replace(" ", "\n  "))}
+    assert affected_tasks(TASK_TEMPLATES, old, new) == []
@@ -0,0 +1,174 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_TTL = 6 * 60 * 60  # seconds
+DEFAULT_MAXSIZE = 1024
+
+_EDGE_PUNCT_RE = re.compile(r"^[\s\"'`.,;:!?]+|[\s\"'`.,;:!?]+$")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(query):
+    """Cache key for a query: case-folded, trimmed of surrounding quotes/punctuation, single-spaced."""
+    return " ".join(_EDGE_PUNCT_RE.sub("", query.casefold()).split())
+
+
+#*-----------------Backends-----------------*#
+
+class DuckDuckGoBackend:
+    """DuckDuckGo through LangChain, with one client reused for every query."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def search(self, query):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_community.tools import DuckDuckGoSearchRun
+                    self._client = DuckDuckGoSearchRun()
+        return self._client.run(query)
+
+
+class LocalCorpusBackend:
+    """
+    Offline stand-in for web search: returns the documents sharing the most
+    words with the query. Useful for tests and benchmarks.
+    """
+
+    def __init__(self, documents, top_k=3):
+        # documents: {title: text}
+        self.documents = dict(documents)
+        self.top_k = top_k
+        self._terms = {title: set(_WORD_RE.findall(f"{title} {text}".lower())) for title, text in self.documents.items()}
+
+    @classmethod
+    def from_jsonl(cls, path, **kwargs):
+        documents = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    doc = json.loads(line)
+                    documents[doc["title"]] = doc["text"]
+        return cls(documents, **kwargs)
+
+    def search(self, query):
+        terms = set(_WORD_RE.findall(query.lower()))
+        scored = sorted(
+            ((len(terms & doc_terms), title) for title, doc_terms in self._terms.items()),
+            key=lambda item: (-item[0], item[1]),
+        )
+        hits = [title for score, title in scored[:self.top_k] if score > 0]
+        if not hits:
+            return "No good search result was found"
+        return "\n\n".join(f"{title}: {self.documents[title]}" for title in hits)
+
+
+#*-----------------Cache-----------------*#
+
+class _DiskStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        return self._connect().execute(
+            "SELECT value, expires FROM search_cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+
+    def put(self, key, value, expires):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)", (key, value, expires))
+
+
+class CachedSearch:
+    """
+    Search front-end shared by all agents. Queries are normalized, answered
+    from an in-memory TTL LRU (backed by an optional SQLite file), and
+    concurrent identical queries are coalesced into a single backend call.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE, disk_path=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.disk = _DiskStore(disk_path) if disk_path else None
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_cached(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+        if self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                return row[0]
+        return None
+
+    def _remember(self, key, value, expires):
+        with self._lock:
+            self._memory[key] = (expires, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def run(self, query):
+        key = normalize_query(query)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            # a leader may have finished between the cache check and here
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            value = self.backend.search(query.strip())
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            expires = time.time() + self.ttl
+            self._remember(key, value, expires)
+            if self.disk is not None:
+                self.disk.put(key, value, expires)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)